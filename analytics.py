@@ -0,0 +1,301 @@
+from array import array
+from collections import OrderedDict, deque
+from functools import lru_cache
+from urllib.parse import urlsplit
+import atexit, heapq, os, sqlite3, threading, time
+
+# Resoluções das séries: nome -> duração de cada intervalo em segundos
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Quantidade de intervalos mantidos em cada resolução (padrão: 1 hora, 7 dias e 90 dias);
+# intervalos mais antigos são descartados
+RETENTION = {
+    'minute': int(os.environ.get('ANALYTICS_MINUTES', 60)),
+    'hour': int(os.environ.get('ANALYTICS_HOURS', 24 * 7)),
+    'day': int(os.environ.get('ANALYTICS_DAYS', 90)),
+}
+
+# Classes de navegador contadas para cada link
+USER_AGENT_CLASSES = ('bot', 'mobile', 'desktop', 'other')
+
+# Quantidade máxima de sites de origem distintos guardados por link (o resto conta como "other")
+MAX_REFERRERS = 100
+
+# Quantidade de eventos somados de cada vez com a trava das estatísticas; entre um lote e o
+# seguinte as consultas podem ser atendidas
+DRAIN_BATCH = 1000
+
+
+# Array com um único zero, multiplicado para criar os arrays zerados (mais rápido que bytes())
+ZERO = array('I', [0])
+
+
+# Função para classificar o navegador a partir do cabeçalho User-Agent (os mesmos valores se
+# repetem muito, então os resultados recentes ficam guardados)
+@lru_cache(maxsize=4096)
+def user_agent_class(user_agent):
+    user_agent = user_agent.lower()
+    if any(word in user_agent for word in ('bot', 'spider', 'crawl')):
+        return 'bot'
+    if any(word in user_agent for word in ('mobi', 'android', 'iphone')):
+        return 'mobile'
+    if 'mozilla' in user_agent:
+        return 'desktop'
+    return 'other'
+
+# Função para extrair o site de origem do cabeçalho Referer
+@lru_cache(maxsize=4096)
+def referrer_host(referrer):
+    if not referrer:
+        return 'direct'
+    return urlsplit(referrer).netloc or 'direct'
+
+
+# Série temporal circular guardada em um array de inteiros. Cada posição guarda o total
+# acumulado de cliques até o fim daquele intervalo (módulo 2**32), e não só os cliques do
+# intervalo: os cliques de qualquer trecho são a diferença entre dois totais, sem somar os
+# intervalos um a um. O anel tem uma posição a mais que a retenção, com o total de antes do
+# intervalo mais antigo.
+class Series:
+    def __init__(self, step, slots):
+        self.step = step
+        self.slots = slots
+        self.totals = ZERO * (slots + 1)
+        self.latest = None  # Número do intervalo mais recente
+
+    def total(self, bucket):
+        return self.totals[bucket % (self.slots + 1)]
+
+    def add(self, timestamp, count=1):
+        bucket = int(timestamp // self.step)
+        size = self.slots + 1
+        if self.latest is None:
+            self.latest = bucket
+        if bucket > self.latest:  # Os intervalos novos começam com o total do mais recente
+            current = self.totals[self.latest % size]
+            for new in range(max(self.latest + 1, bucket - size + 1), bucket + 1):
+                self.totals[new % size] = current
+            self.latest = bucket
+        elif bucket <= self.latest - self.slots:  # Fora da retenção
+            return
+        for later in range(bucket, self.latest + 1):  # Um clique atrasado soma também nos seguintes
+            self.totals[later % size] = (self.totals[later % size] + count) & 0xFFFFFFFF
+
+    # Função para somar os cliques dos intervalos de first a last, dentro da retenção
+    def clicks(self, first, last):
+        if self.latest is None:
+            return 0
+        first = max(first, self.latest - self.slots + 1)
+        last = min(last, self.latest)
+        if first > last:
+            return 0
+        return (self.total(last) - self.total(first - 1)) & 0xFFFFFFFF
+
+    # Função para listar os pares (início do intervalo, cliques) entre start e end
+    def range(self, start, end):
+        if self.latest is None:
+            return []
+        first = max(int(start // self.step), self.latest - self.slots + 1)
+        last = min(int(end // self.step), self.latest)
+        return [(bucket * self.step, self.clicks(bucket, bucket)) for bucket in range(first, last + 1)]
+
+
+# Estatísticas de um link: uma série por resolução, sites de origem e classes de navegador
+class LinkStats:
+    def __init__(self):
+        self.series = {name: Series(step, RETENTION[name]) for name, step in RESOLUTIONS.items()}
+        self.referrers = {}
+        self.user_agents = ZERO * len(USER_AGENT_CLASSES)
+        self.total = 0
+
+    def add(self, timestamp, referrer, user_agent):
+        for series in self.series.values():
+            series.add(timestamp)
+        if referrer in self.referrers or len(self.referrers) < MAX_REFERRERS:
+            self.referrers[referrer] = self.referrers.get(referrer, 0) + 1
+        else:
+            self.referrers['other'] = self.referrers.get('other', 0) + 1
+        self.user_agents[USER_AGENT_CLASSES.index(user_agent)] += 1
+        self.total += 1
+
+    # Função para dizer se todos os cliques do link já saíram da retenção de todas as séries
+    def expired(self, now):
+        return all(series.latest is None or series.latest <= int(now // series.step) - series.slots
+                   for series in self.series.values())
+
+
+# Estatísticas de cliques. O redirecionamento só acrescenta o evento em um buffer circular
+# (deque com tamanho máximo); uma thread em segundo plano esvazia o buffer a cada "interval"
+# segundos e soma os eventos nas séries, que é onde as consultas leem.
+#
+# Os links ficam em ordem do último clique. Links sem nenhum clique dentro da retenção são
+# descartados, e acima de "max_links" links os clicados há mais tempo perdem as estatísticas.
+class ClickAnalytics:
+    def __init__(self, buffer_size=100000, interval=1.0, max_links=100000):
+        self.events = deque(maxlen=buffer_size)
+        self.interval = interval
+        self.max_links = max_links
+        self.links = OrderedDict()  # ID encurtado -> LinkStats, do clique mais antigo ao mais recente
+        self.lock = threading.Lock()
+        self.dropped = 0  # Eventos perdidos porque o buffer estava cheio
+        self.evicted = 0  # Links descartados por excederem max_links
+        self.top_cache = {}  # (n, resolução, intervalos, intervalo atual) -> resultado de top()
+        self.worker_pid = None
+        self.start_lock = threading.Lock()
+
+    # Função chamada a cada redirecionamento: não faz nada além de guardar o evento
+    def record(self, short_id, referrer, user_agent):
+        if self.worker_pid != os.getpid():
+            self.start()
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((time.time(), short_id, referrer, user_agent))
+
+    # Função para iniciar a thread de agregação (uma por processo, inclusive após fork do gunicorn)
+    def start(self):
+        with self.start_lock:
+            if self.worker_pid != os.getpid():
+                self.worker_pid = os.getpid()
+                threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.drain()
+
+    # Função para somar nas séries todos os eventos do buffer e descartar os links antigos
+    def drain(self):
+        while self.events:
+            with self.lock:
+                for _ in range(min(DRAIN_BATCH, len(self.events))):
+                    timestamp, short_id, referrer, user_agent = self.events.popleft()
+                    stats = self.links.get(short_id)
+                    if stats is None:
+                        stats = self.links[short_id] = LinkStats()
+                    else:
+                        self.links.move_to_end(short_id)
+                    stats.add(timestamp, referrer_host(referrer), user_agent_class(user_agent))
+                self.top_cache.clear()
+
+        with self.lock:
+            # Os links do início são os clicados há mais tempo: basta remover até o primeiro
+            # que ainda tem cliques dentro da retenção
+            now = time.time()
+            while self.links and next(iter(self.links.values())).expired(now):
+                self.links.popitem(last=False)
+            while len(self.links) > self.max_links:
+                self.links.popitem(last=False)
+                self.evicted += 1
+                self.top_cache.clear()
+
+    # Função para consultar a série de um link entre start e end (None se não houver cliques)
+    def link_stats(self, short_id, resolution, start, end):
+        with self.lock:
+            stats = self.links.get(short_id)
+            if stats is None:
+                return None
+            return {
+                'short_id': short_id,
+                'resolution': resolution,
+                'series': stats.series[resolution].range(start, end),
+                'referrers': dict(stats.referrers),
+                'user_agents': dict(zip(USER_AGENT_CLASSES, stats.user_agents)),
+                'total': stats.total,
+            }
+
+    # Função para listar os "n" links mais clicados nos últimos "buckets" intervalos. Os links
+    # estão em ordem do último clique, então só os do fim da lista, até o primeiro clicado antes
+    # da janela, são considerados, e cada um custa uma subtração. O resultado fica guardado até
+    # chegarem novos eventos ou até o intervalo atual mudar.
+    def top(self, n, resolution, buckets):
+        last = int(time.time() // RESOLUTIONS[resolution])
+        first = last - buckets + 1
+        key = (n, resolution, buckets, last)
+        with self.lock:
+            result = self.top_cache.get(key)
+            if result is None:
+                totals = []
+                for short_id in reversed(self.links):
+                    series = self.links[short_id].series[resolution]
+                    if series.latest < first:
+                        break
+                    totals.append((series.clicks(first, last), short_id))
+                result = self.top_cache[key] = [{'short_id': short_id, 'clicks': clicks}
+                                                for clicks, short_id in heapq.nlargest(n, totals) if clicks]
+            return [dict(entry) for entry in result]
+
+
+# Estatísticas de cliques no armazenamento compartilhado (SQLite), para vários processos: cada
+# worker do gunicorn guarda os eventos no seu buffer como em ClickAnalytics, mas a thread de
+# agregação soma os cliques do lote no banco (uma transação por lote) em vez de na memória do
+# processo, e as consultas leem do banco o total de todos os workers.
+class SharedClickAnalytics(ClickAnalytics):
+    def __init__(self, storage, buffer_size=100000, interval=1.0):
+        super().__init__(buffer_size, interval)
+        self.storage = storage
+
+    # Na saída do processo os eventos que ainda estão no buffer são gravados
+    def start(self):
+        with self.start_lock:
+            if self.worker_pid != os.getpid():
+                self.worker_pid = os.getpid()
+                threading.Thread(target=self.run, daemon=True).start()
+                atexit.register(self.drain)
+
+    # Função para somar os eventos do buffer e gravar os totais no banco
+    def drain(self):
+        with self.lock:  # A thread e o atexit não gravam o mesmo lote duas vezes
+            now = time.time()
+            oldest = {name: int(now // step) - RETENTION[name] + 1 for name, step in RESOLUTIONS.items()}
+            series = {}
+            sources = {}
+            count = len(self.events)
+            for _ in range(count):
+                timestamp, short_id, referrer, user_agent = self.events.popleft()
+                for name, step in RESOLUTIONS.items():
+                    bucket = int(timestamp // step)
+                    if bucket >= oldest[name]:
+                        key = (name, bucket, short_id)
+                        series[key] = series.get(key, 0) + 1
+                for key in ((short_id, 'referrer', referrer_host(referrer)),
+                            (short_id, 'user_agent', user_agent_class(user_agent))):
+                    sources[key] = sources.get(key, 0) + 1
+            if not count:
+                return
+            try:
+                self.storage.add_clicks(series, sources, oldest, MAX_REFERRERS)
+            except sqlite3.Error:  # Banco indisponível: o lote é perdido, mas a thread continua
+                self.dropped += count
+
+    # Função para consultar a série de um link entre start e end (None se não houver cliques)
+    def link_stats(self, short_id, resolution, start, end):
+        sources = self.storage.click_sources(short_id)
+        if not sources['user_agent']:
+            return None
+        step = RESOLUTIONS[resolution]
+        latest = int(time.time() // step)
+        first = max(int(start // step), latest - RETENTION[resolution] + 1)
+        last = min(int(end // step), latest)
+        clicks = dict(self.storage.link_clicks(short_id, resolution, first, last))
+        return {
+            'short_id': short_id,
+            'resolution': resolution,
+            'series': [(bucket * step, clicks.get(bucket, 0)) for bucket in range(first, last + 1)],
+            'referrers': sources['referrer'],
+            'user_agents': {name: sources['user_agent'].get(name, 0) for name in USER_AGENT_CLASSES},
+            'total': sum(sources['user_agent'].values()),
+        }
+
+    # Função para listar os "n" links mais clicados nos últimos "buckets" intervalos
+    def top(self, n, resolution, buckets):
+        last = int(time.time() // RESOLUTIONS[resolution])
+        return [{'short_id': short_id, 'clicks': clicks}
+                for short_id, clicks in self.storage.top_clicks(resolution, last - buckets + 1, last, n)]
+
+
+# Função para escolher as estatísticas de acordo com o armazenamento: na memória do processo
+# ou, se o armazenamento é compartilhado por vários processos, no próprio banco
+def create_analytics(storage, buffer_size=100000, interval=1.0, max_links=100000):
+    if storage.shared:
+        return SharedClickAnalytics(storage, buffer_size, interval)
+    return ClickAnalytics(buffer_size, interval, max_links)
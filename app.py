@@ -1,47 +1,429 @@
-from flask import Flask, request, redirect, render_template_string
-import re, json, os, random, string
-import requests
+from flask import Flask, Response, abort, before_render_template, g, request, redirect, render_template, stream_with_context, template_rendered
+import re, os, json, threading, atexit, hashlib, math, time
+import click
+from analytics import RESOLUTIONS, RETENTION, create_analytics
+from cache import BloomFilter, TTLCache
+from idgen import create_id_generator
+from metrics import Counter, Gauge, Histogram, Registry, SamplingProfiler
+from ranking import AccessRanking
+from storage import DuplicateIdError, create_storage, load_json, save_json
+from validation import check_url, check_url_later, check_urls, head_latency, url_cache
 
 # Para criar a aplicação da web
 app = Flask(__name__)
 
+# Arquivos estáticos (CSS) ficam em cache no navegador por um ano; a URL leva um hash do
+# conteúdo, então uma mudança no arquivo gera uma URL nova
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 3600
+with open(os.path.join(app.static_folder, 'style.css'), 'rb') as file:
+    STATIC_VERSION = hashlib.sha1(file.read()).hexdigest()[:12]
+
+@app.context_processor
+def inject_static_version():
+    return {'static_version': STATIC_VERSION}
+
+# Métricas servidas em /metrics no formato de texto do Prometheus. Com vários workers do
+# gunicorn, defina METRICS_DIR (um diretório vazio a cada início do servidor): cada worker grava
+# ali os seus valores e /metrics responde com a soma de todos. Sem METRICS_DIR, /metrics mostra
+# só os valores do worker que atendeu a coleta.
+metrics = Registry(os.environ.get('METRICS_DIR'), interval=float(os.environ.get('METRICS_INTERVAL', 1)))
+request_latency = metrics.register(Histogram('shortener_request_duration_seconds', 'Tempo de resposta por rota', ('route', 'method')))
+request_count = metrics.register(Counter('shortener_requests_total', 'Requisições por rota e status', ('route', 'method', 'status')))
+stage_latency = metrics.register(Histogram('shortener_stage_duration_seconds', 'Tempo de cada etapa do processamento', ('stage',)))
+storage_writes = metrics.register(Counter('shortener_storage_writes_total', 'Escritas no armazenamento', ('kind',)))
+storage_records = metrics.register(Counter('shortener_storage_records_total', 'Registros gravados no armazenamento', ('op',)))
+validation_results = metrics.register(Counter('shortener_validation_results_total', 'Resultados da validação de URLs', ('result',)))
+metrics.register(head_latency)
+
+# Função para marcar o início da requisição
+@app.before_request
+def start_request_timer():
+    metrics.start()
+    g.request_start = time.perf_counter()
+
+# Função para registrar o tempo e o status da requisição. Em respostas enviadas aos poucos
+# (NDJSON), mede só até o início do envio.
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_latency.observe(time.perf_counter() - g.request_start, route, request.method)
+        request_count.inc(route, request.method, response.status_code)
+    return response
+
+# Funções para medir a renderização de cada template
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    if 'render_start' in g:
+        stage_latency.observe(time.perf_counter() - g.pop('render_start'), 'render')
+
 # Variável para a URL base
 BASE_URL = "https://projetolayers.onrender.com/"
 
 # Arquivo para armazenar URLs encurtadas
 URL_FILE = "urls.json"
 
-# Função para gerar um ID aleatório
-def generate_random_id(length=6):
-    characters = string.ascii_letters + string.digits + '_-'
-    return ''.join(random.choice(characters) for _ in range(length))
+# Armazenamento das URLs: "log" (log de registros + snapshot), "json" (arquivo único)
+# ou "sqlite" (banco compartilhado entre vários workers do gunicorn)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'log')
+storage = create_storage(STORAGE_BACKEND, URL_FILE)
+
+# Carregar URLs do armazenamento (com um armazenamento compartilhado, o banco é consultado
+# sob demanda e nada é carregado na memória)
+url_list = [] if storage.shared else storage.load()
+
+# Índice das URLs por ID encurtado, mantido em sincronia com url_list (busca em O(1))
+url_index = {url['short_id']: url for url in url_list}
+
+# Com um armazenamento compartilhado, os links mais acessados ficam em um cache LRU limitado.
+# Cada entrada vale por HOT_LINKS_TTL segundos, para um link desativado por outro worker deixar
+# de redirecionar em todos eles.
+HOT_LINKS_SIZE = int(os.environ.get('HOT_LINKS_SIZE', 10000))
+HOT_LINKS_TTL = float(os.environ.get('HOT_LINKS_TTL', 60))
+hot_links = TTLCache(HOT_LINKS_SIZE)
+
+# Filtro de Bloom com os IDs existentes no banco compartilhado: IDs desconhecidos (por exemplo,
+# de robôs testando IDs aleatórios) são recusados sem procurá-los no banco. Quando outro worker
+# grava no banco, os IDs novos são trazidos para o filtro antes de recusar um ID.
+KNOWN_IDS_CAPACITY = int(os.environ.get('KNOWN_IDS_CAPACITY', 1000000))
+known_ids = BloomFilter(KNOWN_IDS_CAPACITY)
+known_ids_rowid = 0  # Último rowid já incluído no filtro
+known_ids_lock = threading.Lock()
+unknown_id_rejections = 0  # IDs recusados pelo filtro sem consultar o banco
+
+# Função para trazer para o filtro os IDs criados desde a última sincronização
+def sync_known_ids():
+    global known_ids, known_ids_rowid
+    with known_ids_lock:
+        for rowid, short_id in storage.ids_after(known_ids_rowid):
+            known_ids.add(short_id)
+            known_ids_rowid = rowid
+        # Filtro cheio: reconstrói com o dobro do tamanho. O tamanho do banco vem do rowid, e não
+        # dos IDs incluídos no filtro, que contariam duas vezes os que este processo criou.
+        if known_ids_rowid > known_ids.capacity:
+            rebuilt = BloomFilter(max(known_ids.capacity, known_ids_rowid) * 2)
+            for rowid, short_id in storage.ids_after(0):
+                rebuilt.add(short_id)
+            known_ids = rebuilt
+
+# Função para dizer se o ID pode existir no banco compartilhado
+def may_exist(short_id):
+    if short_id in known_ids:
+        return True
+    if storage.changed_by_others():  # Pode haver IDs novos criados por outros workers
+        sync_known_ids()
+        return short_id in known_ids
+    return False
+
+if storage.shared:
+    sync_known_ids()
+
+# Índice das URLs por número de acessos, usado para paginar a lista sem ordená-la
+ranking = AccessRanking()
+for position, url in enumerate(url_list):
+    ranking.add(url['short_id'], position, url['access_count'])
+
+# Estratégia de geração de IDs: "random" (aleatório com nova tentativa), "counter" (contador
+# em base64url) ou "block" (cada worker reserva blocos de ID_BLOCK_SIZE valores do contador)
+ID_STRATEGY = os.environ.get('ID_STRATEGY', 'random')
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 1000))
+id_generator = create_id_generator(ID_STRATEGY, exists=lambda short_id: short_id in RESERVED_IDS or find_url(short_id) is not None,
+                                   reserve=storage.reserve_ids, block_size=ID_BLOCK_SIZE)
+
+# Função para gerar um ID que ainda não está em uso
+def generate_short_id():
+    return id_generator.generate()
+
+# Trava que protege url_list, url_index e os contadores pendentes
+url_lock = threading.Lock()
+flush_lock = threading.Lock()
+
+# Intervalo (em segundos) e quantidade de cliques pendentes que disparam a gravação em lote
+FLUSH_INTERVAL = float(os.environ.get('FLUSH_INTERVAL', 5))
+FLUSH_THRESHOLD = int(os.environ.get('FLUSH_THRESHOLD', 1000))
+
+# Cliques ainda não gravados (por ID encurtado) e sinal para acordar a thread de gravação
+pending_accesses = {}
+dirty_count = 0
+flush_event = threading.Event()
+flusher_pid = None
+
+# Função para buscar uma URL pelo ID encurtado. Só o redirecionamento passa count=True: as
+# métricas do cache e de IDs recusados medem os cliques, e não as verificações de IDs livres
+# feitas na criação de links. Links desativados não são encontrados, mas o ID continua ocupado.
+def find_url(short_id, count=False):
+    global unknown_id_rejections
+    if not storage.shared:
+        url = url_index.get(short_id)  # Retorna o registro da URL ou None se o ID não existir
+        return None if url is None or url.get('disabled') else url
+
+    url = hot_links.get(short_id, count)
+    if url is not None:
+        return url
+    if not may_exist(short_id):  # O filtro garante que o ID não existe
+        if count:
+            unknown_id_rejections += 1
+        return None
+    with stage_latency.time('storage_get'):
+        stored = storage.get(short_id)  # O ID pode ter sido criado por outro worker
+    if stored is None:
+        return None
+    return add_url(stored['original_url'], short_id, stored['access_count'])
+
+# Função para adicionar uma URL à lista e ao índice (ou ao cache, com armazenamento compartilhado)
+def add_url(original_url, short_id, access_count=0):
+    url = {'original_url': original_url, 'short_id': short_id, 'access_count': access_count}
+    if storage.shared:
+        with known_ids_lock:
+            known_ids.add(short_id)
+        hot_links.set(short_id, url, HOT_LINKS_TTL)
+        return url
+    with url_lock:
+        if short_id in url_index:  # Outra thread já adicionou o mesmo ID
+            return url_index[short_id]
+        ranking.add(short_id, len(url_list), access_count)
+        url_list.append(url)
+        url_index[short_id] = url
+    return url
+
+# Função para gravar registros no armazenamento, medindo o tempo de cada escrita
+def append_records(records):
+    with stage_latency.time('storage_append'):
+        storage.append(records)
+    storage_writes.inc('append')
+    for record in records:
+        storage_records.inc(record['op'], amount=record.get('count', 1))
+
+# Função para criar uma URL, gravando-a no armazenamento antes de torná-la visível.
+# Retorna None se o ID já existir: no banco compartilhado quem recusa é a chave primária; nos
+# outros armazenamentos, que não verificam duplicatas, o índice é consultado dentro da trava.
+def create_url(original_url, short_id, access_count=0):
+    with flush_lock:
+        if not storage.shared and short_id in url_index:
+            return None
+        try:
+            append_records([{'op': 'create', 'url': {'original_url': original_url, 'short_id': short_id, 'access_count': access_count}}])
+        except DuplicateIdError:
+            return None
+        url = add_url(original_url, short_id, access_count)
+        compact_if_needed()
+    return url
+
+# Função para desativar um link: ele deixa de redirecionar, mas o ID continua ocupado
+def disable_url(short_id):
+    with flush_lock:
+        append_records([{'op': 'disable', 'short_id': short_id}])
+        if storage.shared:
+            hot_links.delete(short_id)
+        else:
+            with url_lock:
+                url = url_index.get(short_id)
+                if url is not None:
+                    url['disabled'] = True
+            compact_if_needed()
+
+# Função para criar várias URLs gravando o lote inteiro de uma só vez.
+# Retorna o conjunto de IDs criados.
+def create_urls(urls):
+    with flush_lock:
+        if not storage.shared:  # Descarta IDs já existentes ou repetidos no próprio lote
+            unique = {}
+            for url in urls:
+                if url['short_id'] not in url_index:
+                    unique.setdefault(url['short_id'], url)
+            urls = list(unique.values())
+        try:
+            append_records([{'op': 'create', 'url': url} for url in urls])
+        except DuplicateIdError:
+            pass  # Algum ID foi criado por outro worker: cria um a um abaixo
+        else:
+            for url in urls:
+                add_url(url['original_url'], url['short_id'], url['access_count'])
+            compact_if_needed()
+            return {url['short_id'] for url in urls}
+    return {url['short_id'] for url in urls
+            if create_url(url['original_url'], url['short_id'], url['access_count']) is not None}
+
+# Função para percorrer todas as URLs em ordem de criação (do banco, quando ele é compartilhado)
+def iter_urls():
+    if storage.shared:
+        yield from storage.iter_all()
+    else:
+        for position in range(len(url_list)):  # Links criados durante a leitura entram no fim
+            yield dict(url_list[position])
+
+# Tamanho padrão e máximo de uma página da lista de URLs
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 500
+
+# Função para ler uma página da lista de URLs.
+# sort: "created" (ordem de criação) ou "access" (mais acessadas primeiro).
+# after: cursor da página anterior (posição, ou (acessos, posição) na ordem por acessos).
+# Retorna as URLs da página e o cursor da próxima página (None se for a última).
+def list_page(sort, after, limit):
+    with stage_latency.time('list_page'):
+        if storage.shared:
+            return storage.page(sort, after, limit)
+        with url_lock:
+            if sort == 'access':
+                entries = ranking.page(after, limit)
+                urls = [dict(url_list[position]) for _, position in entries]
+                next_after = entries[-1] if len(entries) == limit else None
+            else:
+                start = 0 if after is None else after + 1
+                urls = [dict(url) for url in url_list[start:start + limit]]
+                next_after = start + limit - 1 if start + limit < len(url_list) else None
+    return urls, next_after
+
+# Funções para converter o cursor de paginação em texto para a URL e de volta
+def encode_cursor(after):
+    if after is None:
+        return None
+    return '.'.join(str(part) for part in after) if isinstance(after, tuple) else str(after)
+
+def decode_cursor(sort, cursor):
+    if not cursor:
+        return None
+    parts = tuple(int(part) for part in cursor.split('.'))
+    if len(parts) != (2 if sort == 'access' else 1) or any(part < 0 for part in parts):
+        raise ValueError(cursor)
+    return parts if sort == 'access' else parts[0]
+
+# Função para ler os parâmetros de paginação da requisição (erro 400 se forem inválidos)
+def page_arguments():
+    sort = request.args.get('sort', 'created')
+    try:
+        if sort not in ('created', 'access'):
+            raise ValueError(sort)
+        after = decode_cursor(sort, request.args.get('cursor'))
+        limit = min(max(int(request.args.get('limit', LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+    except ValueError:
+        abort(400)
+    return sort, after, limit
+
+# Função para copiar a lista de URLs sem os cliques que ainda não foram gravados no log
+def snapshot_urls():
+    with url_lock:
+        return [dict(url, access_count=url['access_count'] - pending_accesses.get(url['short_id'], 0))
+                for url in url_list]
+
+# Função para compactar o armazenamento quando necessário (chamada com flush_lock)
+def compact_if_needed():
+    if storage.needs_compaction():
+        with stage_latency.time('storage_compact'):
+            storage.compact(snapshot_urls())
+        storage_writes.inc('compact')
+
+# Função para gravar no armazenamento os contadores pendentes
+def flush_urls():
+    global dirty_count
+    with stage_latency.time('flush'), flush_lock:  # Uma gravação por vez, para uma cópia antiga nunca sobrescrever uma mais nova
+        with url_lock:
+            records = [{'op': 'access', 'short_id': short_id, 'count': count}
+                       for short_id, count in pending_accesses.items()]
+            pending_accesses.clear()
+            dirty_count = 0
+        append_records(records)
+        compact_if_needed()
 
-# Função para carregar URLs do arquivo
-def load_urls():
-    if os.path.exists(URL_FILE):  # Verifica se o arquivo de URLs existe
-        with open(URL_FILE, 'r') as file:  # Abre o arquivo em modo de leitura
-            return json.load(file)  # Carrega e retorna o conteúdo do arquivo como uma lista de URLs
-    return []  # Retorna uma lista vazia se o arquivo não existir
+# Função executada pela thread que grava os contadores em segundo plano
+def flush_worker():
+    while True:
+        flush_event.wait(FLUSH_INTERVAL)  # Acorda no intervalo ou quando o limite de cliques é atingido
+        flush_event.clear()
+        if dirty_count:
+            flush_urls()
 
-# Função para salvar URLs no arquivo
-def save_urls(url_list):
-    with open(URL_FILE, 'w') as file:  # Abre o arquivo em modo de escrita
-        json.dump(url_list, file)  # Converte a lista de URLs para JSON e salva no arquivo
+# Função para iniciar a thread de gravação (uma por processo, inclusive após fork do gunicorn)
+def start_flusher():
+    global flusher_pid
+    if flusher_pid != os.getpid():
+        flusher_pid = os.getpid()
+        threading.Thread(target=flush_worker, daemon=True).start()
 
-# Carregar URLs do arquivo
-url_list = load_urls()
+# Função para registrar um acesso sem nenhuma escrita em disco
+def record_access(url):
+    global dirty_count
+    start_flusher()
+    with url_lock:
+        if not storage.shared:
+            ranking.increment(url['short_id'], url['access_count'])
+        url['access_count'] += 1
+        pending_accesses[url['short_id']] = pending_accesses.get(url['short_id'], 0) + 1
+        dirty_count += 1
+        if dirty_count >= FLUSH_THRESHOLD:
+            flush_event.set()
+
+# Grava os contadores pendentes ao encerrar o processo
+@atexit.register
+def flush_on_exit():
+    if dirty_count:
+        flush_urls()
+
+# Comando "flask export-urls": exporta todas as URLs para um arquivo JSON
+@app.cli.command('export-urls')
+@click.argument('path')
+def export_urls(path):
+    flush_urls()
+    save_json(path, list(iter_urls()) if storage.shared else snapshot_urls())
+
+# Comando "flask import-urls": importa URLs de um arquivo JSON, ignorando IDs já existentes
+@app.cli.command('import-urls')
+@click.argument('path')
+def import_urls(path):
+    create_urls([{'original_url': url['original_url'], 'short_id': url['short_id'], 'access_count': url.get('access_count', 0)}
+                 for url in load_json(path) if find_url(url['short_id']) is None])
+
+# IDs que coincidem com rotas do próprio site (/list, /metrics): um link com esse ID nunca
+# seria alcançado, então eles não podem ser escolhidos nem gerados
+RESERVED_IDS = {'list', 'metrics'}
 
 # Função para validar a string do link encurtado
 def is_valid_short_id(short_id):
+    if short_id in RESERVED_IDS:
+        return False
     return re.match("^[a-zA-Z0-9_-]+$", short_id) is not None  # Verifica se o ID encurtado contém apenas caracteres permitidos
 
-# Função para verificar se a URL é válida
+# Modo de validação: "sync" (valida antes de criar o link) ou "background" (cria e valida depois).
+# No modo "background", um link cuja URL não responde é desativado: o ID continua ocupado, mas
+# o redirecionamento passa a responder "URL não encontrada" (nos outros workers, em até
+# HOT_LINKS_TTL segundos).
+VALIDATION_MODE = os.environ.get('VALIDATION_MODE', 'sync')
+
+# Função para verificar se a URL é válida (no modo "background" ela é aceita na hora e
+# verificada depois de o link ser criado, em validate_later)
 def is_url_valid(url):
-    try:
-        response = requests.head(url, allow_redirects=True)
-        return response.status_code == 200
-    except requests.RequestException:
-        return False
+    if VALIDATION_MODE == 'background':
+        return True
+    with stage_latency.time('validation'):
+        verdict = check_url(url)
+    validation_results.inc('valid' if verdict else 'invalid')
+    return verdict
+
+# Função para validar em segundo plano a URL de um link recém-criado (só no modo "background")
+def validate_later(short_id, url):
+    if VALIDATION_MODE != 'background':
+        return
+
+    def on_invalid(url):
+        validation_results.inc('invalid')
+        app.logger.warning('URL não respondeu à validação, link %s desativado: %s', short_id, url)
+        disable_url(short_id)
+
+    check_url_later(url, on_invalid, lambda url: validation_results.inc('valid'))
+
+# A página inicial não muda: é renderizada uma única vez e reaproveitada
+cached_home_page = None
+
+def home_page():
+    global cached_home_page
+    if cached_home_page is None:
+        cached_home_page = render_template('home.html')
+    return cached_home_page
 
 @app.route('/', methods=['GET', 'POST'])  # Define a rota principal que aceita métodos GET e POST
 def home():
@@ -49,300 +431,241 @@ def home():
         original_url = request.form['url']  # Obtém a URL original do formulário
         short_id = request.form['short_id'].strip()  # Obtém o ID encurtado do formulário e remove espaços em branco
 
-        if not short_id:  # Se o ID encurtado estiver vazio, gera um ID aleatório
-            short_id = generate_random_id()
+        generated = not short_id
+        if generated:  # Se o ID encurtado estiver vazio, gera um ID livre
+            short_id = generate_short_id()
 
         # Verifica se a URL é válida
         if not is_url_valid(original_url):
-            return render_template_string('''
-                <!DOCTYPE html>
-                <html lang="en">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>Encurtador de Links</title>
-                    <style> 
-                        body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                        .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                        h1 { text-align: center; color: #009bb5; }
-                        form { display: flex; flex-direction: column; }
-                        input[type="text"] { padding: 10px; margin-bottom: 10px; border: 1px solid #009bb5; border-radius: 4px; background-color: #ffffff; color: #009bb5; }
-                        input[type="submit"] { padding: 10px; background: #009bb5; color: #ffffff; border: none; border-radius: 4px; cursor: pointer; }
-                        input[type="submit"]:hover { background: #007b8f; }
-                        .result { margin-top: 20px; }
-                        .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                        .button:hover { background-color: #007b8f; }
-                        .error { color: #ff0000; font-size: 16px; text-align: center; margin-top: 20px; }
-                    </style> 
-                </head>
-                <body>
-                    <div class="container"> 
-                        <h1>Encurtador de Links</h1> 
-                        <form method="post"> 
-                            URL: <input type="text" name="url" required> 
-                            ID Encurtado: <input type="text" name="short_id" placeholder="Opcional" value="{{ short_id }}"> 
-                            <input type="submit" value="Encurtar"> 
-                        </form> 
-                        <div class="result"> 
-                            <p class="error">URL não encontrada. Tente novamente.</p>
-                            <p><a href="/list" class="button">Ver todas as URLs</a></p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-            ''', base_url=BASE_URL, short_id=short_id)
+            return render_template('home.html', short_id=short_id, error='URL não encontrada. Tente novamente.')
 
         if not is_valid_short_id(short_id):  # Verifica se o ID encurtado é válido
-            return render_template_string('''
-                <!DOCTYPE html>
-                <html lang="en">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>Encurtador de Links</title>
-                    <style> 
-                        body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                        .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                        h1 { text-align: center; color: #009bb5; }
-                        form { display: flex; flex-direction: column; }
-                        input[type="text"] { padding: 10px; margin-bottom: 10px; border: 1px solid #009bb5; border-radius: 4px; background-color: #ffffff; color: #009bb5; }
-                        input[type="submit"] { padding: 10px; background: #009bb5; color: #ffffff; border: none; border-radius: 4px; cursor: pointer; }
-                        input[type="submit"]:hover { background: #007b8f; }
-                        .result { margin-top: 20px; }
-                        a { color: #009bb5; text-decoration: none; }
-                        a:hover { text-decoration: underline; }
-                        .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                        .button:hover { background-color: #007b8f; }
-                        .copy-button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                        .copy-button:hover { background-color: #007b8f; }
-                        .error { color: #ff0000; font-size: 16px; text-align: center; margin-top: 20px; }
-                    </style> 
-                </head>
-                <body>
-                    <div class="container"> 
-                        <h1>Encurtador de Links</h1> 
-                        <form method="post"> 
-                            URL: <input type="text" name="url" required> 
-                            ID Encurtado: <input type="text" name="short_id" placeholder="Opcional" value="{{ short_id }}"> 
-                            <input type="submit" value="Encurtar"> 
-                        </form> 
-                        <div class="result"> 
-                            <p class="error">ID inválido. Use apenas letras, números, hífens e underscores.</p>
-                            <p><a href="/list" class="button">Ver todas as URLs</a></p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-            ''', base_url=BASE_URL, short_id=short_id)
-
-        for url in url_list:  # Verifica se o ID encurtado já existe
-            if url['short_id'] == short_id:
-                return render_template_string('''
-                    <!DOCTYPE html>
-                    <html lang="en">
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>Encurtador de Links</title>
-                        <style> 
-                            body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                            .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                            h1 { text-align: center; color: #009bb5; }
-                            form { display: flex; flex-direction: column; }
-                            input[type="text"] { padding: 10px; margin-bottom: 10px; border: 1px solid #009bb5; border-radius: 4px; background-color: #ffffff; color: #009bb5; }
-                            input[type="submit"] { padding: 10px; background: #009bb5; color: #ffffff; border: none; border-radius: 4px; cursor: pointer; }
-                            input[type="submit"]:hover { background: #007b8f; }
-                            .result { margin-top: 20px; }
-                            a { color: #009bb5; text-decoration: none; }
-                            a:hover { text-decoration: underline; }
-                            .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                            .button:hover { background-color: #007b8f; }
-                            .copy-button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                            .copy-button:hover { background-color: #007b8f; }
-                            .error { color: #ff0000; font-size: 16px; text-align: center; margin-top: 20px; }
-                        </style> 
-                    </head>
-                    <body>
-                        <div class="container"> 
-                            <h1>Encurtador de Links</h1> 
-                            <form method="post"> 
-                                URL: <input type="text" name="url" required> 
-                                ID Encurtado: <input type="text" name="short_id" placeholder="Opcional" value="{{ short_id }}"> 
-                                <input type="submit" value="Encurtar"> 
-                            </form> 
-                            <div class="result"> 
-                                <p class="error">O ID encurtado já existe. Escolha outro.</p>
-                                <p><a href="/list" class="button">Ver todas as URLs</a></p>
-                            </div>
-                        </div>
-                    </body>
-                    </html>
-                ''', base_url=BASE_URL, short_id=short_id)
-
-        url_list.append({'original_url': original_url, 'short_id': short_id, 'access_count': 0})
-        save_urls(url_list)
-
-        return render_template_string('''
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Encurtador de Links</title>
-                <style> 
-                    body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                    .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                    h1 { text-align: center; color: #009bb5; }
-                    form { display: flex; flex-direction: column; }
-                    input[type="text"] { padding: 10px; margin-bottom: 10px; border: 1px solid #009bb5; border-radius: 4px; background-color: #ffffff; color: #009bb5; }
-                    input[type="submit"] { padding: 10px; background: #009bb5; color: #ffffff; border: none; border-radius: 4px; cursor: pointer; }
-                    input[type="submit"]:hover { background: #007b8f; }
-                    .result { margin-top: 20px; }
-                    a { color: #009bb5; text-decoration: none; }
-                    a:hover { text-decoration: underline; }
-                    .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                    .button:hover { background-color: #007b8f; }
-                    .copy-button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                    .copy-button:hover { background-color: #007b8f; }
-                </style> 
-            </head>
-            <body>
-                <div class="container"> 
-                    <h1>Encurtador de Links</h1> 
-                    <div class="result" align="center"> 
-                        <p>URL encurtada: <a href="{{ base_url }}/{{ short_id }}" target="_blank">{{ base_url }}/{{ short_id }}</a></p>
-                        <button class="copy-button" onclick="copyToClipboard('{{ base_url }}/{{ short_id }}')">Copiar</button>
-                        <p><a href="/list" class="button">Ver todas as URLs</a></p>
-                        <p><a href="/" class="button">Voltar à página inicial</a></p>
-                        <script>
-                            function copyToClipboard(text) {
-                                navigator.clipboard.writeText(text).then(function() {
-                                    alert('Link copiado para a área de transferência!');
-                                }, function(err) {
-                                    console.error('Erro ao copiar para a área de transferência: ', err);
-                                });
-                            }
-                        </script>
-                    </div>
-                </div>
-            </body>
-            </html>
-        ''', base_url=BASE_URL, short_id=short_id)
-
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Encurtador de Links</title>
-            <style> 
-                body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                h1 { text-align: center; color: #009bb5; }
-                form { display: flex; flex-direction: column; }
-                input[type="text"] { padding: 10px; margin-bottom: 10px; border: 1px solid #009bb5; border-radius: 4px; background-color: #ffffff; color: #009bb5; }
-                input[type="submit"] { padding: 10px; background: #009bb5; color: #ffffff; border: none; border-radius: 4px; cursor: pointer; }
-                input[type="submit"]:hover { background: #007b8f; }
-                .result { margin-top: 20px; }
-                a { color: #009bb5; text-decoration: none; }
-                a:hover { text-decoration: underline; }
-                .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                .button:hover { background-color: #007b8f; }
-                .copy-button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                .copy-button:hover { background-color: #007b8f; }
-            </style> 
-        </head>
-        <body>
-            <div class="container"> 
-                <h1>Encurtador de Links</h1> 
-                <form method="post"> 
-                    URL: <input type="text" name="url" required> 
-                    ID Encurtado: <input type="text" name="short_id" placeholder="Opcional"> 
-                    <input type="submit" value="Encurtar"> 
-                </form> 
-                <div class="result"> 
-                    <p><a href="/list" class="button">Ver todas as URLs</a></p>
-                </div>
-            </div>
-        </body>
-        </html>
-    ''')
+            return render_template('home.html', short_id=short_id, error='ID inválido. Use apenas letras, números, hífens e underscores.')
+
+        # Verifica se o ID encurtado já existe (a criação também falha se outro worker acabou de usá-lo)
+        created = find_url(short_id) is None and create_url(original_url, short_id) is not None
+        while not created and generated:  # Outro worker usou o ID gerado nesse meio-tempo: gera outro
+            short_id = generate_short_id()
+            created = create_url(original_url, short_id) is not None
+        if not created:
+            return render_template('home.html', short_id=short_id, error='O ID encurtado já existe. Escolha outro.')
+
+        validate_later(short_id, original_url)
+        return render_template('result.html', base_url=BASE_URL, short_id=short_id)
+
+    return home_page()
+
+# Estatísticas de cliques por link (séries por minuto, hora e dia). Com um armazenamento de
+# um único processo ficam na memória, para no máximo ANALYTICS_MAX_LINKS links (os clicados há
+# mais tempo são descartados); com o SQLite cada worker grava os seus cliques no banco a cada
+# ANALYTICS_INTERVAL segundos, e as consultas somam os cliques de todos os workers.
+analytics = create_analytics(storage,
+                             buffer_size=int(os.environ.get('ANALYTICS_BUFFER_SIZE', 100000)),
+                             interval=float(os.environ.get('ANALYTICS_INTERVAL', 1)),
+                             max_links=int(os.environ.get('ANALYTICS_MAX_LINKS', 100000)))
+
+# Modo de redirecionamento: "tracking" (302 sem cache, cada clique passa pelo servidor e é
+# contado) ou "cached" (REDIRECT_STATUS 301 ou 308 com Cache-Control: o navegador guarda o
+# redirecionamento por REDIRECT_MAX_AGE segundos e os cliques repetidos não são contados)
+REDIRECT_MODE = os.environ.get('REDIRECT_MODE', 'tracking')
+REDIRECT_STATUS = int(os.environ.get('REDIRECT_STATUS', 301))
+REDIRECT_MAX_AGE = int(os.environ.get('REDIRECT_MAX_AGE', 86400))
+if REDIRECT_MODE not in ('tracking', 'cached') or REDIRECT_STATUS not in (301, 308):
+    raise ValueError(f'Modo de redirecionamento inválido: {REDIRECT_MODE} {REDIRECT_STATUS}')
 
 @app.route('/<short_id>', methods=['GET'])
 def redirect_to_url(short_id):
-    for url in url_list:
-        if url['short_id'] == short_id:
-            url['access_count'] += 1
-            save_urls(url_list)
-            return redirect(url['original_url'])
+    url = find_url(short_id, count=True)
+    if url is not None:
+        record_access(url)  # O contador é gravado depois, em lote
+        analytics.record(short_id, request.headers.get('Referer'), request.headers.get('User-Agent', ''))
+        if REDIRECT_MODE == 'cached':
+            response = redirect(url['original_url'], code=REDIRECT_STATUS)
+            response.headers['Cache-Control'] = f'public, max-age={REDIRECT_MAX_AGE}'
+        else:
+            response = redirect(url['original_url'])
+            response.headers['Cache-Control'] = 'private, no-store'
+        return response
 
     return "URL não encontrada"
 
+# Quantidade máxima de links aceitos em uma única requisição de criação em lote
+BULK_MAX_RECORDS = int(os.environ.get('BULK_MAX_RECORDS', 50000))
+
+# Quantidade de registros verificados, validados e gravados de cada vez; os resultados de um
+# bloco são enviados ao cliente antes de o próximo começar
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+
+# Função para ler os registros do corpo da requisição (lista JSON ou NDJSON).
+# Linhas NDJSON que não são JSON válido viram None. Retorna None se o corpo não for uma lista.
+def bulk_records():
+    if request.mimetype != 'application/x-ndjson':
+        return request.get_json(silent=True)
+    records = []
+    for line in request.get_data(as_text=True).splitlines():
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+    return records
+
+# Função para criar um bloco de registros; "seen" guarda os IDs já usados nos blocos anteriores.
+# Retorna um resultado por registro, na mesma ordem.
+def bulk_create_chunk(records, seen):
+    # Uma única passada pelos registros: verifica os IDs contra o índice e contra o próprio lote
+    results = []
+    for record in records:
+        if not isinstance(record, dict):
+            results.append({'status': 'invalid_record'})
+            continue
+        original_url = str(record.get('original_url', ''))
+        short_id = str(record.get('short_id') or '').strip()
+        if not short_id:  # Se o ID encurtado estiver vazio, gera um ID livre
+            short_id = generate_short_id()
+        if not is_valid_short_id(short_id):
+            status = 'invalid_id'
+        elif short_id in seen or find_url(short_id) is not None:
+            status = 'duplicate'
+        else:
+            status = 'pending'
+            seen.add(short_id)
+        results.append({'original_url': original_url, 'short_id': short_id, 'status': status})
+
+    # Valida as URLs em paralelo (cada URL distinta uma única vez)
+    pending = [result for result in results if result['status'] == 'pending']
+    if VALIDATION_MODE == 'background':
+        verdicts = {result['original_url']: True for result in pending}  # Validadas depois de criadas
+    else:
+        with stage_latency.time('validation_batch'):
+            verdicts = check_urls({result['original_url'] for result in pending})
+        for verdict in verdicts.values():
+            validation_results.inc('valid' if verdict else 'invalid')
+    for result in pending:
+        if not verdicts[result['original_url']]:
+            result['status'] = 'invalid_url'
+
+    # Grava todos os links válidos do bloco em uma única escrita
+    created = create_urls([{'original_url': result['original_url'], 'short_id': result['short_id'], 'access_count': 0}
+                           for result in results if result['status'] == 'pending'])
+    for result in results:
+        if result['status'] == 'pending':
+            result['status'] = 'created' if result['short_id'] in created else 'duplicate'
+        if result['status'] == 'created':
+            result['short_url'] = f"{BASE_URL}/{result['short_id']}"
+            validate_later(result['short_id'], result['original_url'])
+    return results
+
+# Cria vários links de uma vez. Aceita uma lista JSON ou NDJSON (um objeto por linha) com
+# {"original_url": ..., "short_id": ...} e devolve uma linha NDJSON de resultado por registro,
+# na ordem recebida. Os registros são processados em blocos de BULK_CHUNK_SIZE e cada bloco
+# é enviado assim que fica pronto. Registros que não são objetos JSON recebem "invalid_record".
+@app.route('/api/bulk', methods=['POST'])
+def bulk_create():
+    records = bulk_records()
+    if not isinstance(records, list) or len(records) > BULK_MAX_RECORDS:
+        return {'error': f'Envie uma lista com no máximo {BULK_MAX_RECORDS} registros.'}, 400
+
+    def generate():
+        seen = set()
+        for start in range(0, len(records), BULK_CHUNK_SIZE):
+            for result in bulk_create_chunk(records[start:start + BULK_CHUNK_SIZE], seen):
+                yield json.dumps(result) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/list', methods=['GET'])
 def list_urls():
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Lista de URLs Encurtadas</title>
-            <style> 
-                body { font-family: Helvetica, sans-serif; margin: 0; padding: 0; background-color: #000000; color: #009bb5; } 
-                .container { width: 50%; margin: auto; overflow: hidden; padding: 20px; background: #ffffff; margin-top: 50px; box-shadow: 0 0 10px rgba(0, 0, 0, 0.1); }
-                h1 { text-align: center; color: #009bb5; }
-                table { width: 100%; border-collapse: collapse; margin-top: 20px; }
-                th, td { padding: 10px; border: 1px solid #009bb5; text-align: left; }
-                th { background-color: #009bb5; color: #ffffff; }
-                tr:nth-child(even) { background-color: #f2f2f2; }
-                a { color: #009bb5; text-decoration: none; }
-                a:hover { text-decoration: underline; }
-                .button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                .button:hover { background-color: #007b8f; }
-                .copy-button { display: inline-block; padding: 10px 20px; background-color: #009bb5; color: #ffffff; border: none; border-radius: 4px; text-align: center; cursor: pointer; }
-                .copy-button:hover { background-color: #007b8f; }
-            </style> 
-        </head>
-        <body>
-            <div class="container"> 
-                <h1>Lista de URLs Encurtadas</h1> 
-                <table>
-                    <thead>
-                        <tr>
-                            <th>URL Original</th> <!--mudar isso-->
-                            <th>URL Encurtada</th>
-                            <th>Acessos</th>
-                            <th>Ações</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {% for url in url_list %}
-                            <tr>
-                                <td>{{ url.original_url }}</td>
-                                <td><a href="{{ base_url }}/{{ url.short_id }}" target="_blank">{{ base_url }}/{{ url.short_id }}</a></td>
-                                <td>{{ url.access_count }}</td>
-                                <td>
-                                    <button class="copy-button" onclick="copyToClipboard('{{ base_url }}/{{ url.short_id }}')">Copiar</button>
-                                </td>
-                            </tr>
-                        {% endfor %}
-                    </tbody>
-                </table>
-                <p><a href="/" class="button">Voltar à página inicial</a></p>
-                <script>
-                    function copyToClipboard(text) {
-                        navigator.clipboard.writeText(text).then(function() {
-                            alert('Link copiado para a área de transferência!');
-                        }, function(err) {
-                            console.error('Erro ao copiar para a área de transferência: ', err);
-                        });
-                    }
-                </script>
-            </div>
-        </body>
-        </html>
-    ''', url_list=url_list, base_url=BASE_URL)
+    sort, after, limit = page_arguments()
+    urls, next_after = list_page(sort, after, limit)
+    return render_template('list.html', url_list=urls, base_url=BASE_URL, sort=sort, limit=limit,
+                           next_cursor=encode_cursor(next_after))
+
+# Versão em JSON da lista, para painéis: mesmos parâmetros sort, cursor e limit
+@app.route('/api/urls', methods=['GET'])
+def list_urls_json():
+    sort, after, limit = page_arguments()
+    urls, next_after = list_page(sort, after, limit)
+    return {'urls': urls, 'next_cursor': encode_cursor(next_after)}
+
+# Exporta todas as URLs em NDJSON, enviando as linhas aos poucos em vez de montar a resposta inteira
+@app.route('/api/urls/export', methods=['GET'])
+def export_urls_stream():
+    def generate():
+        for url in iter_urls():
+            yield json.dumps(url) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=urls.ndjson'})
+
+# Função para ler a resolução das estatísticas da requisição (erro 400 se for inválida)
+def resolution_argument():
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in RESOLUTIONS:
+        abort(400)
+    return resolution
+
+# Cliques de um link ao longo do tempo: parâmetros resolution (minute, hour ou day) e
+# start/end (timestamps Unix; o padrão é todo o período guardado)
+@app.route('/api/stats/<short_id>', methods=['GET'])
+def link_stats(short_id):
+    resolution = resolution_argument()
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - RESOLUTIONS[resolution] * RETENTION[resolution]))
+    except ValueError:
+        abort(400)
+    if not (math.isfinite(start) and math.isfinite(end)):  # float() também aceita "inf" e "nan"
+        abort(400)
+    stats = analytics.link_stats(short_id, resolution, start, end)
+    if stats is None:
+        if find_url(short_id) is None:
+            abort(404)
+        stats = {'short_id': short_id, 'resolution': resolution, 'series': [], 'referrers': {}, 'user_agents': {}, 'total': 0}
+    return stats
+
+# Links mais clicados: parâmetros n, resolution e last (quantidade de intervalos recentes)
+@app.route('/api/top', methods=['GET'])
+def top_links():
+    resolution = resolution_argument()
+    try:
+        n = min(max(int(request.args.get('n', 10)), 1), 1000)
+        last = min(max(int(request.args.get('last', 24)), 1), RETENTION[resolution])
+    except ValueError:
+        abort(400)
+    return {'resolution': resolution, 'last': last, 'links': analytics.top(n, resolution, last)}
+
+# Contadores mantidos pelos próprios componentes, lidos na hora da coleta
+metrics.register(Gauge('shortener_cache_lookups_total', 'Consultas aos caches por resultado', lambda: {
+    ('hot_links', 'hit'): hot_links.hits, ('hot_links', 'miss'): hot_links.misses,
+    ('validation', 'hit'): url_cache.hits, ('validation', 'miss'): url_cache.misses,
+}, ('cache', 'result'), kind='counter'))
+metrics.register(Gauge('shortener_unknown_id_rejections_total', 'IDs recusados pelo filtro de Bloom sem consultar o banco',
+                       lambda: unknown_id_rejections, kind='counter'))
+metrics.register(Gauge('shortener_id_collisions_total', 'Colisões encontradas ao gerar IDs',
+                       lambda: id_generator.collisions, kind='counter'))
+metrics.register(Gauge('shortener_pending_accesses', 'Cliques ainda não gravados no armazenamento', lambda: dirty_count))
+metrics.register(Gauge('shortener_analytics_dropped_total', 'Cliques descartados com o buffer de estatísticas cheio',
+                       lambda: analytics.dropped, kind='counter'))
+metrics.register(Gauge('shortener_analytics_evicted_total', 'Links cujas estatísticas foram descartadas por exceder o limite',
+                       lambda: analytics.evicted, kind='counter'))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_page():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Profiler por amostragem, desligado por padrão. Com PROFILER_ENABLED=1, POST em
+# /debug/profiler/start começa a coletar as pilhas do processo que atendeu a requisição e
+# /debug/profiler/stop devolve as pilhas no formato "folded" (entrada do flamegraph.pl)
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+profiler = SamplingProfiler(interval=float(os.environ.get('PROFILER_INTERVAL', 0.005)))
+
+@app.route('/debug/profiler/<action>', methods=['POST'])
+def profiler_control(action):
+    if not PROFILER_ENABLED or action not in ('start', 'stop'):
+        abort(404)
+    if action == 'start':
+        profiler.start()
+        return {'profiling': True, 'pid': os.getpid()}
+    return Response(profiler.stop(), mimetype='text/plain')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,98 @@
+# Funções comuns ao benchmark.py e ao loadtest.py: tráfego com distribuição Zipf, percentis
+# de latência e relatórios em JSON que podem ser comparados entre execuções
+import bisect, json, os, platform, random, subprocess, time
+
+
+# Sorteia posições de 0 a size-1 seguindo uma distribuição Zipf: a posição 0 é a mais
+# acessada, como acontece com os poucos links "quentes" do tráfego real
+class ZipfSampler:
+    def __init__(self, size, exponent=1.1, seed=0):
+        self.cumulative = []
+        total = 0.0
+        for rank in range(1, size + 1):
+            total += 1 / rank ** exponent
+            self.cumulative.append(total)
+        self.total = total
+        self.random = random.Random(seed)
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.random.random() * self.total)
+
+
+# Sorteia posições de 0 a size-1 com a mesma probabilidade
+class UniformSampler:
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.random = random.Random(seed)
+
+    def sample(self):
+        return self.random.randrange(self.size)
+
+
+# Função para criar o sorteador de links ("zipf" ou "uniform")
+def create_sampler(distribution, size, exponent=1.1, seed=0):
+    if distribution == 'zipf':
+        return ZipfSampler(size, exponent, seed)
+    return UniformSampler(size, seed)
+
+
+# Função para calcular um percentil de uma lista ordenada de amostras
+def percentile(samples, pct):
+    index = min(len(samples) - 1, int(len(samples) * pct / 100))
+    return samples[index]
+
+
+# Função para resumir as latências (em segundos) de um cenário
+def summarize(scenario, size, samples, elapsed):
+    samples = sorted(samples)
+    return {
+        'scenario': scenario,
+        'size': size,
+        'requests': len(samples),
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(samples, 50) * 1e3,
+        'p90_ms': percentile(samples, 90) * 1e3,
+        'p99_ms': percentile(samples, 99) * 1e3,
+        'max_ms': samples[-1] * 1e3,
+    }
+
+
+# Função para imprimir os resultados em uma tabela
+def print_results(results):
+    print(f"{'cenário':>16} {'links':>9} {'req':>7} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['scenario']:>16} {r['size']:>9} {r['requests']:>7} {r['throughput_rps']:>9.0f} "
+              f"{r['p50_ms']:>8.3f} {r['p90_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['max_ms']:>8.3f}")
+
+
+# Função para gravar o relatório em JSON, com dados da máquina e do commit testado
+def write_report(path, results, **settings):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': settings,
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+# Função para comparar os resultados com um relatório anterior (variação em %)
+def compare_reports(path, results):
+    with open(path, 'r') as file:
+        previous = {(r['scenario'], r['size']): r for r in json.load(file)['results']}
+    print(f"{'cenário':>16} {'links':>9} {'p50':>9} {'p99':>9} {'req/s':>9}   (variação contra {path})")
+    for r in results:
+        old = previous.get((r['scenario'], r['size']))
+        if old is None:
+            continue
+        changes = [(r[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                   for key in ('p50_ms', 'p99_ms', 'throughput_rps')]
+        print(f"{r['scenario']:>16} {r['size']:>9} " + ' '.join(f'{change:>+8.1f}%' for change in changes))
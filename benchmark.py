@@ -0,0 +1,189 @@
+# Microbenchmarks do encurtador, pelo cliente de teste do Flask (sem rede). Para carga HTTP
+# real contra o gunicorn, veja loadtest.py --http.
+#
+# redirect: latência de redirecionamento em função do número de links armazenados, com
+#           tráfego Zipf (poucos links concentram os cliques) ou uniforme
+# create:   criação de links pelo formulário (POST /), com a validação da URL desligada
+# list:     primeira página de /list e uma página no meio da lista (cursor profundo), em
+#           ordem de criação e por acessos
+# all:      redirect, create e list
+# render:   tempo de renderização das páginas compilando o template a cada requisição
+#           (como fazia render_template_string) contra os templates pré-compilados
+# ids:      vazão e taxa de colisão de cada estratégia de geração de IDs, com o espaço de
+#           IDs já ocupado por N links
+#
+# Uso: python benchmark.py [--mode all|redirect|create|list|render|ids] [--sizes 1000,10000,100000,1000000]
+#                          [--requests 2000] [--distribution zipf|uniform] [--output relatorio.json]
+#                          [--compare relatorio_anterior.json]
+import argparse, os, secrets, tempfile, time
+
+# Usa um arquivo temporário para não tocar no urls.json real
+os.chdir(tempfile.mkdtemp())
+
+import app as shortener
+from bench_report import compare_reports, create_sampler, print_results, summarize, write_report
+from cache import BloomFilter
+from idgen import ALPHABET, create_id_generator
+
+# Quantidade de links gravados de cada vez no banco compartilhado
+POPULATE_CHUNK_SIZE = 10000
+
+
+# Função para preencher o armazenamento com N links falsos. Com um armazenamento de um único
+# processo basta preencher a lista e o índice; com o SQLite os redirecionamentos leem do banco,
+# então ele é esvaziado e recebe os links, e os caches do processo começam vazios.
+def populate(size):
+    if shortener.storage.shared:
+        with shortener.storage.connection() as conn:
+            conn.execute('DELETE FROM urls')
+        shortener.hot_links.clear()
+        shortener.known_ids = BloomFilter(shortener.KNOWN_IDS_CAPACITY)
+        shortener.known_ids_rowid = 0
+        for start in range(0, size, POPULATE_CHUNK_SIZE):
+            shortener.create_urls([{'original_url': f'https://example.com/{i}', 'short_id': f'id{i}', 'access_count': 0}
+                                   for i in range(start, min(start + POPULATE_CHUNK_SIZE, size))])
+        shortener.hot_links.clear()
+        return
+    shortener.url_list.clear()
+    shortener.url_index.clear()
+    shortener.ranking.clear()
+    for i in range(size):
+        shortener.add_url(f'https://example.com/{i}', f'id{i}')
+
+
+# Função para medir uma sequência de requisições com o cliente de teste do Flask.
+# "requests" é uma lista de (método, caminho, dados do formulário).
+def run_requests(scenario, size, requests, expected_status):
+    client = shortener.app.test_client()
+    samples = []
+    begin = time.perf_counter()
+    for method, path, data in requests:
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == expected_status, (path, response.status_code)
+    return summarize(scenario, size, samples, time.perf_counter() - begin)
+
+
+# Função para medir a latência dos redirecionamentos (o status esperado depende de REDIRECT_MODE)
+def bench_redirect(size, requests_count, distribution):
+    sampler = create_sampler(distribution, size)
+    requests = [('GET', f'/id{sampler.sample()}', None) for _ in range(requests_count)]
+    status = shortener.REDIRECT_STATUS if shortener.REDIRECT_MODE == 'cached' else 302
+    return run_requests('redirect', size, requests, status)
+
+
+# Função para medir a criação de links pelo formulário (IDs novos, gerados pelo servidor)
+def bench_create(size, requests_count):
+    requests = [('POST', '/', {'url': f'https://example.com/new/{i}', 'short_id': ''}) for i in range(requests_count)]
+    return run_requests('create', size, requests, 200)
+
+
+# Função para medir a primeira página da lista e uma página do meio (cursor na metade dos
+# links, dentro do grupo de links sem acessos) nas duas ordenações
+def bench_list(size, requests_count):
+    middle = size // 2
+    return [
+        run_requests('list', size, [('GET', '/list', None)] * requests_count, 200),
+        run_requests('list_access', size, [('GET', '/list?sort=access', None)] * requests_count, 200),
+        run_requests('list_deep', size, [('GET', f'/list?cursor={middle}', None)] * requests_count, 200),
+        run_requests('list_access_deep', size, [('GET', f'/list?sort=access&cursor=0.{middle}', None)] * requests_count, 200),
+    ]
+
+
+# Função para medir o tempo médio de uma função em microssegundos
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+# Função para comparar a renderização com e sem o cache de templates compilados
+def bench_render(size, repeat):
+    populate(size)
+    uncached_env = shortener.app.jinja_env.overlay(cache_size=0)  # Recompila tudo a cada chamada
+    pages = {
+        'home': ('home.html', {}),
+        'result': ('result.html', {'base_url': shortener.BASE_URL, 'short_id': 'id0'}),
+        'list': ('list.html', {'base_url': shortener.BASE_URL, 'url_list': shortener.list_page('created', None, size)[0]}),
+    }
+    results = []
+    with shortener.app.test_request_context():
+        for page, (name, context) in pages.items():
+            context = dict(context, static_version=shortener.STATIC_VERSION)
+            before = timeit(lambda: uncached_env.get_template(name).render(context), repeat)
+            after = timeit(lambda: shortener.render_template(name, **context), repeat)
+            results.append({'page': page, 'before_us': before, 'after_us': after})
+    return results
+
+
+# Função para medir cada estratégia de ID com "size" IDs aleatórios de "length" caracteres já em uso
+def bench_ids(size, requests_count, length):
+    existing = {''.join(secrets.choice(ALPHABET) for _ in range(length)) for _ in range(size)}
+    results = []
+    for strategy in ('random', 'counter', 'block'):
+        generator = create_id_generator(strategy, exists=existing.__contains__, reserve=shortener.storage.reserve_ids)
+        if strategy == 'random':
+            generator.length = length
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            existing.add(generator.generate())
+        elapsed = time.perf_counter() - start
+        results.append({
+            'strategy': strategy,
+            'size': size,
+            'ids_per_s': requests_count / elapsed,
+            'collision_rate': generator.collisions / (generator.collisions + generator.generated),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks do encurtador')
+    parser.add_argument('--mode', choices=['all', 'redirect', 'create', 'list', 'render', 'ids'], default='redirect')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--distribution', choices=['zipf', 'uniform'], default='zipf')
+    parser.add_argument('--id-length', type=int, default=4, help='tamanho dos IDs aleatórios no modo ids')
+    parser.add_argument('--output', help='grava os resultados em JSON neste arquivo')
+    parser.add_argument('--compare', help='compara os resultados com um relatório JSON anterior')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.mode == 'ids':
+        print(f"{'estratégia':>10} {'links':>10} {'IDs/s':>12} {'colisões':>10}")
+        for size in sizes:
+            for result in bench_ids(size, args.requests, args.id_length):
+                print(f"{result['strategy']:>10} {result['size']:>10} {result['ids_per_s']:>12.0f} {result['collision_rate']:>10.2%}")
+        return
+
+    if args.mode == 'render':
+        print(f"{'página':>10} {'antes (us)':>12} {'depois (us)':>12}")
+        for result in bench_render(shortener.LIST_PAGE_SIZE, max(1, args.requests // 10)):
+            print(f"{result['page']:>10} {result['before_us']:>12.1f} {result['after_us']:>12.1f}")
+        return
+
+    # A validação faria uma requisição externa por link criado; aqui medimos só o encurtador
+    shortener.is_url_valid = lambda url: True
+
+    results = []
+    for size in sizes:
+        populate(size)
+        if args.mode in ('all', 'redirect'):
+            results.append(bench_redirect(size, args.requests, args.distribution))
+        if args.mode in ('all', 'list'):
+            results.extend(bench_list(size, max(1, args.requests // 10)))
+        if args.mode in ('all', 'create'):
+            results.append(bench_create(size, args.requests))
+
+    print_results(results)
+    if args.output:
+        write_report(args.output, results, tool='benchmark', mode=args.mode, requests=args.requests,
+                     distribution=args.distribution, storage=shortener.STORAGE_BACKEND)
+    if args.compare:
+        compare_reports(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
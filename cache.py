@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import hashlib, math, threading, time
+
+# Cache LRU limitado a "maxsize" entradas, com tempo de expiração opcional por entrada e
+# contadores de acertos e falhas (consultas com count=False não entram nos contadores).
+# Seguro para várias threads.
+class TTLCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, count=True):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():  # Entrada vencida
+                del self.data[key]
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            if count:
+                self.hits += 1
+            self.data.move_to_end(key)  # Marca como usada recentemente
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.data[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:  # Remove a entrada usada há mais tempo
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+# Filtro de Bloom: diz com certeza que um ID NÃO existe, ou que ele provavelmente existe
+# (com uma taxa de falsos positivos de "error_rate" enquanto couber em "capacity" itens)
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # Número de bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
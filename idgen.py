@@ -0,0 +1,86 @@
+import os, secrets, string, threading
+
+# Caracteres permitidos nos IDs encurtados (o mesmo alfabeto do base64url)
+ALPHABET = string.ascii_uppercase + string.ascii_lowercase + string.digits + '-_'
+
+# Função para codificar um número em base64url (0 -> "A", 63 -> "_", 64 -> "BA", ...)
+def encode_base64url(number):
+    chars = []
+    while True:
+        number, digit = divmod(number, 64)
+        chars.append(ALPHABET[digit])
+        if number == 0:
+            return ''.join(reversed(chars))
+
+
+# Geradores de ID. Todos recebem "exists", uma função que diz se o ID já está em uso, e
+# contam quantos IDs geraram e quantas colisões encontraram pelo caminho.
+
+# Aleatório seguro (módulo secrets), tentando de novo quando o ID já existe. Depois de
+# várias colisões seguidas o tamanho aumenta, para não travar quando o espaço enche.
+class RandomIdGenerator:
+    def __init__(self, exists, length=6, max_retries=5):
+        self.exists = exists
+        self.length = length
+        self.max_retries = max_retries
+        self.generated = 0
+        self.collisions = 0
+
+    def generate(self):
+        length = self.length
+        while True:
+            for _ in range(self.max_retries):
+                short_id = ''.join(secrets.choice(ALPHABET) for _ in range(length))
+                if not self.exists(short_id):
+                    self.generated += 1
+                    return short_id
+                self.collisions += 1
+            length += 1
+
+
+# Contador codificado em base64url. Os valores vêm do armazenamento em blocos de
+# "block_size": com blocos maiores que 1, cada worker gasta o seu bloco sem falar com os
+# outros a cada requisição. IDs que já existem (por exemplo, escolhidos pelo usuário) são pulados.
+class CounterIdGenerator:
+    def __init__(self, exists, reserve, block_size=1):
+        self.exists = exists
+        self.reserve = reserve
+        self.block_size = block_size
+        self.next_value = 0
+        self.end_value = 0
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.collisions = 0
+
+    def next_counter(self):
+        with self.lock:
+            if self.pid != os.getpid():  # Após o fork, o bloco do processo pai não pode ser reaproveitado
+                self.pid = os.getpid()
+                self.next_value = self.end_value = 0
+            if self.next_value >= self.end_value:
+                self.next_value = self.reserve(self.block_size)
+                self.end_value = self.next_value + self.block_size
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+    def generate(self):
+        while True:
+            short_id = encode_base64url(self.next_counter())
+            if not self.exists(short_id):
+                self.generated += 1
+                return short_id
+            self.collisions += 1
+
+
+# Função para criar o gerador escolhido: "random", "counter" (um valor reservado por ID)
+# ou "block" (blocos de "block_size" valores reservados por worker)
+def create_id_generator(strategy, exists, reserve, block_size=1000):
+    if strategy == 'random':
+        return RandomIdGenerator(exists)
+    if strategy == 'counter':
+        return CounterIdGenerator(exists, reserve)
+    if strategy == 'block':
+        return CounterIdGenerator(exists, reserve, block_size)
+    raise ValueError(f'Estratégia de ID desconhecida: {strategy}')
@@ -0,0 +1,250 @@
+# Testes de carga com vários processos sobre o mesmo armazenamento compartilhado (SQLite)
+#
+# Modo padrão (consistência): cada processo faz o papel de um worker do gunicorn, cria links
+# (alguns com IDs disputados por todos os processos) e registra cliques. No fim, o banco
+# precisa conter todos os links e todos os cliques, sem perdas, inclusive nas estatísticas.
+# Em seguida, para os armazenamentos de um único processo (log e json), várias threads
+# disputam os mesmos IDs dentro de um processo: cada ID só pode ser criado uma vez.
+#
+# Modo --http (desempenho): sobe o gunicorn localmente com um banco de N links e dispara
+# requisições HTTP reais de vários processos clientes (cliques com distribuição Zipf, criações
+# e páginas da lista), medindo percentis de latência e vazão por tipo de requisição.
+#
+# Uso: python loadtest.py [--workers 4] [--links 200] [--clicks 2000]
+#      python loadtest.py --http [--workers 4] [--clients 8] [--sizes 1000,100000,1000000]
+#                         [--requests 2000] [--mix redirect=90,create=5,list=5]
+#                         [--output relatorio.json] [--compare relatorio_anterior.json]
+import argparse, http.client, multiprocessing, os, random, socket, sqlite3, subprocess, sys, tempfile, threading, time
+from urllib.parse import urlencode
+from bench_report import compare_reports, create_sampler, print_results, summarize, write_report
+
+# Configuração do gunicorn usada no modo --http: desliga a validação das URLs em cada worker,
+# para medir só o encurtador e não os sites de destino
+GUNICORN_CONFIG = '''
+def post_worker_init(worker):
+    import app
+    app.is_url_valid = lambda url: True
+'''
+
+
+# Função executada por cada processo
+def worker(worker_id, links, clicks, result):
+    import app as shortener
+    shortener.is_url_valid = lambda url: True  # Não faz requisições externas durante o teste
+    client = shortener.app.test_client()
+
+    created = 0
+    for i in range(links):
+        response = client.post('/', data={'url': f'https://example.com/{worker_id}/{i}', 'short_id': f'w{worker_id}-{i}'})
+        assert 'já existe' not in response.get_data(as_text=True)
+        # ID disputado por todos os processos: só um pode conseguir criá-lo
+        response = client.post('/', data={'url': f'https://example.com/shared/{i}', 'short_id': f'shared-{i}'})
+        if 'já existe' not in response.get_data(as_text=True):
+            created += 1
+
+    rng = random.Random(worker_id)
+    for _ in range(clicks):
+        response = client.get(f'/shared-{rng.randrange(links)}')
+        assert response.status_code == 302
+
+    shortener.flush_urls()  # Grava os cliques pendentes antes de encerrar
+    shortener.analytics.drain()  # E as estatísticas (o processo termina sem passar pelo atexit)
+    result.put(created)
+
+
+# Função executada em um processo novo para cada armazenamento de um único processo: "threads"
+# threads tentam criar os mesmos "links" IDs; retorna quantas criações deram certo, quantos
+# links ficaram no armazenamento e quantos deles têm a URL de quem recebeu a confirmação
+def local_duplicates(backend, threads, links, result):
+    os.chdir(tempfile.mkdtemp())
+    os.environ['STORAGE_BACKEND'] = backend
+    import app as shortener
+    from storage import create_storage
+    shortener.is_url_valid = lambda url: True
+
+    winners = {}
+    def create(thread_id):
+        client = shortener.app.test_client()
+        for i in range(links):
+            response = client.post('/', data={'url': f'https://example.com/{thread_id}/{i}', 'short_id': f'dup-{i}'})
+            if 'já existe' not in response.get_data(as_text=True):
+                winners.setdefault(f'dup-{i}', []).append(f'https://example.com/{thread_id}/{i}')
+    workers = [threading.Thread(target=create, args=(thread_id,)) for thread_id in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    stored = create_storage(backend, shortener.URL_FILE).load()  # Lê de novo do disco
+    matching = sum(1 for url in stored if winners.get(url['short_id']) == [url['original_url']])
+    result.put((sum(len(urls) for urls in winners.values()), len(stored), matching))
+
+
+# Função para criar o banco SQLite com "size" links (id0, id1, ...)
+def populate_database(path, size):
+    from storage import SqliteStorage
+    conn = SqliteStorage(path).connection()
+    with conn:
+        conn.executemany('INSERT INTO urls (short_id, original_url) VALUES (?, ?)',
+                         ((f'id{i}', f'https://example.com/{i}') for i in range(size)))
+
+
+# Função para encontrar uma porta TCP livre
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Função para subir o gunicorn e esperar até ele responder
+def start_gunicorn(port, workers):
+    with open('gunicorn_bench.py', 'w') as file:
+        file.write(GUNICORN_CONFIG)
+    env = dict(os.environ, STORAGE_BACKEND='sqlite',
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')])))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+                               '-c', 'gunicorn_bench.py', 'app:app'], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('Falha: o gunicorn não respondeu')
+
+
+# Função executada por cada processo cliente do modo --http: retorna as latências por cenário
+# e a quantidade de respostas inesperadas
+def http_client(client_id, port, size, requests_count, mix, distribution):
+    sampler = create_sampler(distribution, size, seed=client_id)
+    rng = random.Random(client_id)
+    scenarios, weights = zip(*mix.items())
+    conn = http.client.HTTPConnection('127.0.0.1', port)  # Conexão reaproveitada (keep-alive)
+    samples = {scenario: [] for scenario in scenarios}
+    errors = 0
+    for i in range(requests_count):
+        scenario = rng.choices(scenarios, weights)[0]
+        if scenario == 'redirect':
+            method, path, body, headers, expected = 'GET', f'/id{sampler.sample()}', None, {}, 302
+        elif scenario == 'create':
+            body = urlencode({'url': f'https://example.com/new/{client_id}/{i}', 'short_id': ''})
+            method, path, headers, expected = 'POST', '/', {'Content-Type': 'application/x-www-form-urlencoded'}, 200
+        else:
+            method, path, body, headers, expected = 'GET', '/list', None, {}, 200
+        start = time.perf_counter()
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        response.read()
+        samples[scenario].append(time.perf_counter() - start)
+        if response.status != expected:
+            errors += 1
+    return samples, errors
+
+
+# Função para rodar o modo --http em cada tamanho de base
+def run_http(args):
+    mix = {name: float(weight) for name, weight in (part.split('=') for part in args.mix.split(','))}
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        os.chdir(tempfile.mkdtemp())
+        populate_database('urls.db', size)
+        port = free_port()
+        server = start_gunicorn(port, args.workers)
+        try:
+            with ctx.Pool(args.clients) as pool:
+                begin = time.perf_counter()
+                outputs = pool.starmap(http_client, [(i, port, size, args.requests, mix, args.distribution)
+                                                     for i in range(args.clients)])
+                elapsed = time.perf_counter() - begin
+        finally:
+            server.terminate()
+            server.wait()
+        errors = sum(client_errors for _, client_errors in outputs)
+        for scenario in mix:
+            samples = [sample for client_samples, _ in outputs for sample in client_samples[scenario]]
+            if samples:
+                results.append(dict(summarize(scenario, size, samples, elapsed), errors=errors))
+        if errors:
+            print(f'Atenção: {errors} respostas inesperadas com {size} links')
+
+    print_results(results)
+    if args.output:
+        write_report(args.output, results, tool='loadtest', workers=args.workers, clients=args.clients,
+                     requests_per_client=args.requests, mix=mix, distribution=args.distribution)
+    if args.compare:
+        compare_reports(args.compare, results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Testes de carga com vários processos')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--links', type=int, default=200)
+    parser.add_argument('--clicks', type=int, default=2000)
+    parser.add_argument('--http', action='store_true', help='mede o gunicorn com requisições HTTP reais')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=2000, help='requisições por cliente no modo --http')
+    parser.add_argument('--mix', default='redirect=90,create=5,list=5')
+    parser.add_argument('--distribution', choices=['zipf', 'uniform'], default='zipf')
+    parser.add_argument('--output', help='grava os resultados em JSON neste arquivo')
+    parser.add_argument('--compare', help='compara os resultados com um relatório JSON anterior')
+    args = parser.parse_args()
+
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+    if args.http:
+        run_http(args)
+        return
+
+    os.chdir(tempfile.mkdtemp())
+    os.environ['STORAGE_BACKEND'] = 'sqlite'
+
+    ctx = multiprocessing.get_context('spawn')
+    result = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(i, args.links, args.clicks, result)) for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            raise SystemExit(f'Falha: o processo {process.pid} terminou com erro')
+    shared_created = sum(result.get() for _ in processes)
+
+    conn = sqlite3.connect('urls.db')
+    total_links = conn.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+    total_clicks = conn.execute('SELECT SUM(access_count) FROM urls').fetchone()[0]
+    stats_clicks = conn.execute("SELECT SUM(clicks) FROM clicks WHERE resolution = 'day'").fetchone()[0]
+
+    expected_links = args.workers * args.links + args.links
+    expected_clicks = args.workers * args.clicks
+    print(f'links:   {total_links} (esperado {expected_links})')
+    print(f'cliques: {total_clicks} (esperado {expected_clicks})')
+    print(f'cliques nas estatísticas: {stats_clicks} (esperado {expected_clicks})')
+    print(f'IDs disputados criados: {shared_created} (esperado {args.links})')
+    if (total_links, total_clicks, stats_clicks, shared_created) != (expected_links, expected_clicks, expected_clicks, args.links):
+        raise SystemExit('Falha: links ou cliques perdidos')
+    print('OK: nenhum link ou clique perdido')
+
+    for backend in ('log', 'json'):
+        process = ctx.Process(target=local_duplicates, args=(backend, args.workers, args.links, result))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise SystemExit(f'Falha: o teste de IDs duplicados ({backend}) terminou com erro')
+        created, stored, matching = result.get()
+        print(f'{backend}: criações confirmadas {created}, links gravados {stored}, '
+              f'com a URL confirmada {matching} (esperado {args.links})')
+        if (created, stored, matching) != (args.links, args.links, args.links):
+            raise SystemExit(f'Falha: ID duplicado aceito ({backend})')
+    print('OK: cada ID disputado foi criado uma única vez')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+from collections import Counter as FoldedStacks
+from contextlib import contextmanager
+import atexit, bisect, json, os, sys, threading, time
+
+# Limites (em segundos) dos intervalos dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Função para escrever os rótulos no formato do Prometheus: {route="/list",method="GET"}
+def format_labels(names, values, extra=''):
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+# Cada métrica sabe tirar uma cópia dos seus valores ("samples": valores dos rótulos -> valor),
+# somar duas cópias (de processos diferentes) e escrever uma cópia no formato do Prometheus.
+# Os valores dos rótulos viram texto na cópia, para a cópia poder ser gravada em JSON.
+
+# Contador que só cresce, separado por rótulos
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return {tuple(map(str, label_values)): value for label_values, value in self.values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def render(self, samples):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in sorted(samples.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+# Histograma com intervalos fixos, separado por rótulos
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # Rótulos -> [contagem por intervalo, soma, total]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        with self.lock:
+            return {tuple(map(str, label_values)): [list(counts), total, count]
+                    for label_values, (counts, total, count) in self.values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def render(self, samples):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(samples.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, label_values)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+# Valor lido na hora da coleta por uma função (por exemplo, acertos de um cache já existente).
+# A função retorna um número ou um dicionário {valores dos rótulos: número}. Com kind="counter"
+# o valor só cresce; com kind="gauge" ele descreve o estado atual do processo.
+class Gauge:
+    def __init__(self, name, help, read, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels
+        self.kind = kind
+
+    def samples(self):
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return {tuple(map(str, label_values)): value for label_values, value in values.items()}
+
+    merge = staticmethod(Counter.merge)
+    render = Counter.render
+
+
+# Conjunto de métricas expostas no formato de texto do Prometheus.
+#
+# Com vários processos (workers do gunicorn), cada um tem as suas métricas e uma coleta só
+# chega a um deles. Com "directory", cada processo grava uma cópia dos seus valores em
+# <directory>/<pid>-<início>.json a cada "interval" segundos (e ao encerrar), e render() soma
+# as cópias de todos os processos. Contadores e histogramas de processos que já terminaram
+# continuam somados, para o total nunca diminuir; valores do tipo gauge só contam enquanto o
+# processo está vivo. O diretório deve ser esvaziado antes de o servidor iniciar.
+class Registry:
+    def __init__(self, directory=None, interval=1.0):
+        self.metrics = []
+        self.directory = directory
+        self.interval = interval
+        self.writer_pid = None
+        self.start_lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def samples(self):
+        return {metric.name: metric.samples() for metric in self.metrics}
+
+    # Função para iniciar a thread que grava a cópia dos valores (uma por processo, inclusive
+    # após fork do gunicorn); não faz nada sem "directory"
+    def start(self):
+        if self.directory is None or self.writer_pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.writer_pid != os.getpid():
+                self.writer_pid = os.getpid()
+                self.path = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}.json')
+                os.makedirs(self.directory, exist_ok=True)
+                threading.Thread(target=self.run, daemon=True).start()
+                atexit.register(self.write)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    # Função para gravar a cópia dos valores deste processo (troca atômica do arquivo)
+    def write(self):
+        if self.writer_pid != os.getpid():
+            return
+        data = {name: [[list(label_values), value] for label_values, value in samples.items()]
+                for name, samples in self.samples().items()}
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_file, self.path)
+
+    # Função para somar as cópias gravadas por todos os processos
+    def collect(self):
+        self.start()
+        self.write()  # A cópia deste processo vai atualizada
+        kinds = {metric.name: metric for metric in self.metrics}
+        merged = {metric.name: {} for metric in self.metrics}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            alive = process_alive(int(filename.split('-')[0]))
+            try:
+                with open(os.path.join(self.directory, filename)) as file:
+                    data = json.load(file)
+            except (OSError, ValueError):  # Arquivo removido durante a leitura
+                continue
+            for name, samples in data.items():
+                metric = kinds.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                target = merged[name]
+                for label_values, value in samples:
+                    label_values = tuple(label_values)
+                    target[label_values] = metric.merge(target[label_values], value) if label_values in target else value
+        return merged
+
+    def render(self):
+        samples = self.collect() if self.directory else self.samples()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(samples[metric.name]))
+        return '\n'.join(lines) + '\n'
+
+
+# Função para saber se o processo ainda existe
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Profiler por amostragem: uma thread lê a pilha de todas as outras threads a cada "interval"
+# segundos e conta as pilhas no formato "folded" (a;b;c 42), usado para gerar flame graphs
+# (flamegraph.pl, speedscope). Só custa algo enquanto está ligado.
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = FoldedStacks()
+        self.running = False
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.stacks = FoldedStacks()
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # Função para desligar o profiler; retorna as pilhas coletadas no formato "folded"
+    def stop(self):
+        with self.lock:
+            self.running = False
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+    def run(self):
+        own_id = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
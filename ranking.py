@@ -0,0 +1,124 @@
+import bisect, itertools
+
+
+# Conjunto ordenado de posições, guardado em sublistas ordenadas de até 2 * LOAD itens (com o
+# maior valor de cada uma em "maxes"). Inserir e remover só movem itens dentro de uma sublista,
+# e ler a partir de um valor é uma busca binária, mesmo com milhões de posições no conjunto.
+class SortedPositions:
+    LOAD = 1000
+
+    def __init__(self):
+        self.lists = []
+        self.maxes = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value):
+        if not self.lists:
+            self.lists.append([value])
+            self.maxes.append(value)
+        else:
+            i = bisect.bisect_left(self.maxes, value)
+            if i == len(self.maxes):  # Maior que todos (o caso comum: URL recém-criada)
+                i -= 1
+                self.lists[i].append(value)
+                self.maxes[i] = value
+            else:
+                bisect.insort(self.lists[i], value)
+            if len(self.lists[i]) > 2 * self.LOAD:  # Divide a sublista cheia ao meio
+                half = self.lists[i][self.LOAD:]
+                del self.lists[i][self.LOAD:]
+                self.lists.insert(i + 1, half)
+                self.maxes[i] = self.lists[i][-1]
+                self.maxes.insert(i + 1, half[-1])
+        self.size += 1
+
+    def discard(self, value):
+        i = bisect.bisect_left(self.maxes, value)
+        if i == len(self.maxes):
+            return
+        sublist = self.lists[i]
+        j = bisect.bisect_left(sublist, value)
+        if j == len(sublist) or sublist[j] != value:
+            return
+        del sublist[j]
+        self.size -= 1
+        if not sublist:
+            del self.lists[i]
+            del self.maxes[i]
+        else:
+            self.maxes[i] = sublist[-1]
+
+    # Função para percorrer, em ordem crescente, os valores maiores que "value"
+    def iter_after(self, value):
+        i = bisect.bisect_right(self.maxes, value)
+        if i == len(self.lists):
+            return
+        sublist = self.lists[i]
+        yield from itertools.islice(sublist, bisect.bisect_right(sublist, value), None)
+        for sublist in self.lists[i + 1:]:
+            yield from sublist
+
+
+# Índice das URLs ordenado por número de acessos, mantido a cada clique.
+#
+# As URLs ficam em grupos por contagem de acessos ({contagem: posições em url_list}) e as
+# contagens distintas ficam em uma lista ordenada. Um clique só move a URL de um grupo para o
+# seguinte, e uma página é lida percorrendo os grupos do maior para o menor, sem ordenar a
+# lista inteira a cada requisição. Dentro de um grupo, vale a ordem de criação.
+class AccessRanking:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.buckets = {}  # Contagem de acessos -> posições em url_list (SortedPositions)
+        self.counts = []  # Contagens distintas, em ordem crescente
+        self.positions = {}  # ID encurtado -> posição em url_list
+
+    def add(self, short_id, position, count):
+        self.positions[short_id] = position
+        self.insert(count, position)
+
+    # Função para mover a URL para o grupo da nova contagem
+    def increment(self, short_id, old_count, delta=1):
+        position = self.positions.get(short_id)
+        if position is None:
+            return
+        self.remove(old_count, position)
+        self.insert(old_count + delta, position)
+
+    def insert(self, count, position):
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            bucket = self.buckets[count] = SortedPositions()
+            bisect.insort(self.counts, count)
+        bucket.add(position)
+
+    def remove(self, count, position):
+        bucket = self.buckets[count]
+        bucket.discard(position)
+        if not bucket:
+            del self.buckets[count]
+            del self.counts[bisect.bisect_left(self.counts, count)]
+
+    # Função para ler uma página: retorna até "limit" pares (contagem, posição) em ordem de
+    # acessos decrescente, começando depois do par "after" (o último da página anterior)
+    def page(self, after, limit):
+        result = []
+        if after is None:
+            i = len(self.counts) - 1
+            min_position = -1
+        else:
+            count, min_position = after
+            i = bisect.bisect_right(self.counts, count) - 1
+            if i >= 0 and self.counts[i] != count:  # O grupo do cursor não existe mais
+                min_position = -1
+        while i >= 0 and len(result) < limit:
+            count = self.counts[i]
+            positions = itertools.islice(self.buckets[count].iter_after(min_position), limit - len(result))
+            result.extend((count, position) for position in positions)
+            i -= 1
+            min_position = -1
+        return result
@@ -0,0 +1,382 @@
+import json, os, sqlite3, threading, zlib
+
+# Erro gerado quando o ID encurtado já existe no armazenamento
+class DuplicateIdError(Exception):
+    pass
+
+# Função para carregar URLs de um arquivo JSON (formato usado para importar/exportar)
+def load_json(path):
+    if os.path.exists(path):  # Verifica se o arquivo de URLs existe
+        with open(path, 'r') as file:  # Abre o arquivo em modo de leitura
+            return json.load(file)  # Carrega e retorna o conteúdo do arquivo como uma lista de URLs
+    return []  # Retorna uma lista vazia se o arquivo não existir
+
+# Função para salvar dados em um arquivo JSON de forma atômica
+def save_json(path, data):
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as file:  # Escreve primeiro em um arquivo temporário
+        json.dump(data, file)  # Converte os dados para JSON e salva no arquivo
+        file.flush()
+        os.fsync(file.fileno())  # Garante que os dados chegaram ao disco antes da troca
+    os.replace(temp_file, path)  # Substitui o arquivo de forma atômica (nunca fica pela metade)
+
+
+# Armazenamento antigo: o arquivo JSON inteiro é reescrito a cada gravação
+class JsonStorage:
+    shared = False  # Os dados ficam na memória de um único processo
+
+    def __init__(self, path):
+        self.path = path
+        self.next_id = 0  # O arquivo JSON não guarda o contador: após reiniciar, IDs já usados são pulados
+        self.lock = threading.Lock()
+
+    def load(self):
+        return load_json(self.path)
+
+    # Os registros não são gravados um a um; tudo vai para o disco na compactação
+    def append(self, records):
+        pass
+
+    def needs_compaction(self):
+        return True
+
+    def compact(self, url_list):
+        save_json(self.path, url_list)
+
+    # Função para reservar "count" valores do contador de IDs; retorna o primeiro
+    def reserve_ids(self, count):
+        with self.lock:
+            start = self.next_id
+            self.next_id += count
+        return start
+
+
+# Armazenamento em log: cada criação e cada lote de acessos é uma linha acrescentada ao fim
+# do arquivo (custo O(1) por operação), compactada de tempos em tempos em um snapshot.
+#
+# Cada linha do log tem o formato "<crc32 em hex> <json>\n". Uma linha incompleta ou com CRC
+# errado (escrita interrompida por uma queda) marca o fim do log válido e é descartada.
+class LogStorage:
+    shared = False  # Os dados ficam na memória de um único processo
+
+    def __init__(self, log_path, snapshot_path, import_path=None, compact_threshold=10000):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.import_path = import_path
+        self.compact_threshold = compact_threshold
+        self.seq = 0  # Número de sequência do último registro gravado
+        self.log_records = 0  # Registros no log desde a última compactação
+        self.next_id = 0  # Próximo valor livre do contador de IDs
+        self.lock = threading.Lock()
+
+    # Função para carregar o snapshot e reaplicar o log por cima dele
+    def load(self):
+        if not os.path.exists(self.snapshot_path) and not os.path.exists(self.log_path):
+            # Primeira execução: importa o urls.json antigo, se existir
+            url_list = load_json(self.import_path) if self.import_path else []
+            if url_list:
+                self.compact(url_list)
+            return url_list
+
+        snapshot = load_json(self.snapshot_path) or {'seq': 0, 'urls': []}
+        url_list = snapshot['urls']
+        url_index = {url['short_id']: url for url in url_list}
+        self.seq = snapshot['seq']
+        self.next_id = snapshot.get('next_id', 0)
+        self.log_records = 0
+
+        valid_size = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as file:
+                data = file.read()
+            for line in data.splitlines(keepends=True):
+                record = self.decode(line)
+                if record is None:  # Escrita interrompida: o resto do log é descartado
+                    break
+                valid_size += len(line)
+                self.log_records += 1
+                if record['seq'] <= snapshot['seq']:  # Já incluído no snapshot
+                    continue
+                self.seq = record['seq']
+                if record['op'] == 'reserve':
+                    self.next_id = max(self.next_id, record['next_id'])
+                self.apply(record, url_list, url_index)
+            if valid_size < len(data):
+                with open(self.log_path, 'r+b') as file:
+                    file.truncate(valid_size)
+        return url_list
+
+    # Função para aplicar um registro do log à lista de URLs
+    @staticmethod
+    def apply(record, url_list, url_index):
+        if record['op'] == 'create':
+            url = record['url']
+            if url['short_id'] not in url_index:
+                url_list.append(url)
+                url_index[url['short_id']] = url
+        elif record['op'] == 'access':
+            url = url_index.get(record['short_id'])
+            if url is not None:
+                url['access_count'] += record['count']
+        elif record['op'] == 'disable':
+            url = url_index.get(record['short_id'])
+            if url is not None:
+                url['disabled'] = True
+
+    @staticmethod
+    def encode(record):
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+    @staticmethod
+    def decode(line):
+        if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+            return None
+        payload = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    # Função para acrescentar registros ao log em uma única escrita
+    def append(self, records):
+        if not records:
+            return
+        with self.lock:
+            chunks = []
+            for record in records:
+                self.seq += 1
+                chunks.append(self.encode(dict(record, seq=self.seq)))
+            with open(self.log_path, 'ab') as file:
+                file.write(b''.join(chunks))
+                file.flush()
+                os.fsync(file.fileno())
+            self.log_records += len(records)
+
+    def needs_compaction(self):
+        return self.log_records >= self.compact_threshold
+
+    # Função para gravar o estado completo em um snapshot e esvaziar o log
+    def compact(self, url_list):
+        with self.lock:
+            # O snapshot guarda o último número de sequência: se a queda ocorrer antes de
+            # o log ser esvaziado, os registros antigos são ignorados na próxima carga
+            save_json(self.snapshot_path, {'seq': self.seq, 'next_id': self.next_id, 'urls': url_list})
+            with open(self.log_path, 'wb') as file:
+                os.fsync(file.fileno())
+            self.log_records = 0
+
+    # Função para reservar "count" valores do contador de IDs; retorna o primeiro.
+    # A reserva é gravada no log para que os valores não se repitam após reiniciar.
+    def reserve_ids(self, count):
+        with self.lock:
+            start = self.next_id
+            self.next_id += count
+        self.append([{'op': 'reserve', 'next_id': start + count}])
+        return start
+
+
+# Armazenamento em SQLite (modo WAL), compartilhado por vários processos do gunicorn.
+# O banco é a fonte da verdade: a unicidade do ID é garantida pela chave primária e os
+# contadores são incrementados dentro do próprio banco.
+class SqliteStorage:
+    shared = True  # Vários processos leem e gravam o mesmo banco
+
+    def __init__(self, path, import_path=None):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS urls (
+                short_id TEXT PRIMARY KEY,
+                original_url TEXT NOT NULL,
+                access_count INTEGER NOT NULL DEFAULT 0,
+                disabled INTEGER NOT NULL DEFAULT 0)''')
+            # Bancos criados antes da coluna "disabled" (links desativados pela validação)
+            if 'disabled' not in [row['name'] for row in conn.execute('PRAGMA table_info(urls)')]:
+                conn.execute('ALTER TABLE urls ADD COLUMN disabled INTEGER NOT NULL DEFAULT 0')
+            # Índice para paginar por acessos (a ordem de criação usa o próprio rowid). O SQLite
+            # guarda o rowid como última coluna de todo índice, então ele equivale a
+            # (access_count DESC, rowid) e permite buscar direto por (contagem, rowid).
+            conn.execute('CREATE INDEX IF NOT EXISTS urls_by_access ON urls (access_count DESC)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Estatísticas de cliques compartilhadas pelos workers: cliques por link em cada
+            # intervalo de cada resolução, e cliques por site de origem e classe de navegador
+            conn.execute('''CREATE TABLE IF NOT EXISTS clicks (
+                resolution TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                short_id TEXT NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (resolution, bucket, short_id)) WITHOUT ROWID''')
+            conn.execute('CREATE INDEX IF NOT EXISTS clicks_by_link ON clicks (short_id, resolution, bucket)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS click_sources (
+                short_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (short_id, kind, name)) WITHOUT ROWID''')
+            if import_path and conn.execute('SELECT 1 FROM urls LIMIT 1').fetchone() is None:
+                # Primeira execução: importa o urls.json antigo, se existir
+                conn.executemany('''INSERT OR IGNORE INTO urls (short_id, original_url, access_count)
+                    VALUES (:short_id, :original_url, :access_count)''', load_json(import_path))
+
+    # Função para obter a conexão da thread atual (uma nova conexão após o fork do worker)
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def load(self):
+        rows = self.connection().execute('SELECT short_id, original_url, access_count FROM urls ORDER BY rowid')
+        return [dict(row) for row in rows]
+
+    # Função para percorrer todas as URLs em ordem de criação, sem carregá-las de uma vez
+    def iter_all(self):
+        for row in self.connection().execute('SELECT short_id, original_url, access_count FROM urls ORDER BY rowid'):
+            yield dict(row)
+
+    # Função para ler uma página usando os índices do banco (paginação por cursor)
+    def page(self, sort, after, limit):
+        columns = 'rowid, short_id, original_url, access_count'
+        conn = self.connection()
+        if sort == 'access':
+            if after is None:
+                rows = conn.execute(f'SELECT {columns} FROM urls ORDER BY access_count DESC, rowid LIMIT ?', (limit,))
+            else:
+                # O resto do grupo do cursor e, depois, os grupos seguintes: cada parte é uma busca
+                # no índice (com OR o SQLite percorreria o grupo do cursor inteiro)
+                count, rowid = after
+                rows = conn.execute(f'''SELECT * FROM (SELECT {columns} FROM urls
+                        WHERE access_count = ? AND rowid > ? ORDER BY rowid LIMIT ?)
+                    UNION ALL
+                    SELECT * FROM (SELECT {columns} FROM urls
+                        WHERE access_count < ? ORDER BY access_count DESC, rowid LIMIT ?)
+                    ORDER BY access_count DESC, rowid LIMIT ?''', (count, rowid, limit, count, limit, limit))
+        else:
+            rows = conn.execute(f'SELECT {columns} FROM urls WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                (-1 if after is None else after, limit))
+        rows = rows.fetchall()
+        urls = [{'original_url': row['original_url'], 'short_id': row['short_id'], 'access_count': row['access_count']}
+                for row in rows]
+        if len(rows) < limit:
+            return urls, None
+        last = rows[-1]
+        return urls, (last['access_count'], last['rowid']) if sort == 'access' else last['rowid']
+
+    # Função para saber se outra conexão gravou no banco desde a última chamada nesta thread
+    # (PRAGMA data_version só muda com gravações de outras conexões e não lê nenhuma tabela)
+    def changed_by_others(self):
+        version = self.connection().execute('PRAGMA data_version').fetchone()[0]
+        changed = version != getattr(self.local, 'data_version', None)
+        self.local.data_version = version
+        return changed
+
+    # Função para listar os IDs criados depois de um rowid; retorna pares (rowid, ID)
+    def ids_after(self, rowid):
+        return self.connection().execute('SELECT rowid, short_id FROM urls WHERE rowid > ? ORDER BY rowid',
+                                         (rowid,)).fetchall()
+
+    # Função para buscar uma URL diretamente no banco. Um link desativado não é encontrado,
+    # mas o ID continua ocupado (a chave primária recusa uma nova criação com ele).
+    def get(self, short_id):
+        row = self.connection().execute(
+            'SELECT short_id, original_url, access_count FROM urls WHERE short_id = ? AND NOT disabled',
+            (short_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    # Função para gravar registros em uma única transação
+    def append(self, records):
+        if not records:
+            return
+        conn = self.connection()
+        try:
+            with conn:
+                for record in records:
+                    if record['op'] == 'create':
+                        conn.execute('''INSERT INTO urls (short_id, original_url, access_count)
+                            VALUES (:short_id, :original_url, :access_count)''', record['url'])
+                    elif record['op'] == 'access':
+                        conn.execute('UPDATE urls SET access_count = access_count + ? WHERE short_id = ?',
+                                     (record['count'], record['short_id']))
+                    elif record['op'] == 'disable':
+                        conn.execute('UPDATE urls SET disabled = 1 WHERE short_id = ?', (record['short_id'],))
+        except sqlite3.IntegrityError:
+            raise DuplicateIdError()
+
+    # Função para reservar "count" valores do contador de IDs; retorna o primeiro.
+    # O incremento é atômico no banco, então cada worker recebe uma faixa exclusiva.
+    def reserve_ids(self, count):
+        conn = self.connection()
+        with conn:
+            end = conn.execute('''INSERT INTO counters VALUES ('short_id', ?)
+                ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+                RETURNING value''', (count,)).fetchone()[0]
+        return end - count
+
+    # Função para somar um lote de cliques em uma única transação.
+    # series: {(resolução, intervalo, ID): cliques}; sources: {(ID, tipo, nome): cliques}, onde o
+    # tipo é "referrer" ou "user_agent" (acima de max_sources nomes por link, o resto vira "other");
+    # oldest: {resolução: intervalo mais antigo mantido}, os anteriores são apagados.
+    def add_clicks(self, series, sources, oldest, max_sources):
+        conn = self.connection()
+        with conn:
+            conn.executemany('''INSERT INTO clicks VALUES (?, ?, ?, ?)
+                ON CONFLICT (resolution, bucket, short_id) DO UPDATE SET clicks = clicks + excluded.clicks''',
+                             [key + (clicks,) for key, clicks in series.items()])
+            conn.executemany('''INSERT INTO click_sources
+                SELECT :short_id, :kind, CASE
+                    WHEN EXISTS (SELECT 1 FROM click_sources WHERE short_id = :short_id AND kind = :kind AND name = :name)
+                      OR (SELECT COUNT(*) FROM click_sources WHERE short_id = :short_id AND kind = :kind) < :max_sources
+                    THEN :name ELSE 'other' END, :clicks
+                WHERE true
+                ON CONFLICT (short_id, kind, name) DO UPDATE SET clicks = clicks + excluded.clicks''',
+                             [{'short_id': short_id, 'kind': kind, 'name': name, 'clicks': clicks, 'max_sources': max_sources}
+                              for (short_id, kind, name), clicks in sources.items()])
+            conn.executemany('DELETE FROM clicks WHERE resolution = ? AND bucket < ?', oldest.items())
+
+    # Função para listar os pares (intervalo, cliques) de um link entre os intervalos first e last
+    def link_clicks(self, short_id, resolution, first, last):
+        return self.connection().execute('''SELECT bucket, clicks FROM clicks
+            WHERE short_id = ? AND resolution = ? AND bucket BETWEEN ? AND ? ORDER BY bucket''',
+                                         (short_id, resolution, first, last)).fetchall()
+
+    # Função para ler os cliques de um link por site de origem e por classe de navegador
+    def click_sources(self, short_id):
+        sources = {'referrer': {}, 'user_agent': {}}
+        for kind, name, clicks in self.connection().execute(
+                'SELECT kind, name, clicks FROM click_sources WHERE short_id = ?', (short_id,)):
+            sources[kind][name] = clicks
+        return sources
+
+    # Função para listar os "n" links com mais cliques entre os intervalos first e last
+    def top_clicks(self, resolution, first, last, n):
+        return self.connection().execute('''SELECT short_id, SUM(clicks) AS total FROM clicks
+            WHERE resolution = ? AND bucket BETWEEN ? AND ?
+            GROUP BY short_id ORDER BY total DESC, short_id LIMIT ?''', (resolution, first, last, n)).fetchall()
+
+    # O banco já é o estado completo: não há o que compactar
+    def needs_compaction(self):
+        return False
+
+    def compact(self, url_list):
+        pass
+
+
+# Função para criar o armazenamento escolhido pela variável STORAGE_BACKEND
+def create_storage(backend, url_file):
+    if backend == 'json':
+        return JsonStorage(url_file)
+    if backend == 'log':
+        base = os.path.splitext(url_file)[0]
+        return LogStorage(base + '.log', base + '.snapshot.json', import_path=url_file,
+                          compact_threshold=int(os.environ.get('COMPACT_THRESHOLD', 10000)))
+    if backend == 'sqlite':
+        return SqliteStorage(os.path.splitext(url_file)[0] + '.db', import_path=url_file)
+    raise ValueError(f'Armazenamento desconhecido: {backend}')
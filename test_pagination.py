@@ -0,0 +1,58 @@
+# Testes da paginação por cursor de /api/urls, nas ordens de criação e por acessos
+#
+# Uso: python -m unittest test_pagination
+import os, tempfile, unittest
+
+
+class PaginationTest(unittest.TestCase):
+    # O app grava os links em arquivos no diretório atual: os testes rodam em um diretório temporário
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        import app
+        cls.app = app
+        cls.client = app.app.test_client()
+        for i in range(8):
+            app.create_url(f'https://example.com/{i}', f'x{i}')
+        for i, clicks in ((2, 3), (5, 3), (6, 1)):  # x2 e x5 empatam: vale a ordem de criação
+            for _ in range(clicks):
+                app.record_access(app.find_url(f'x{i}'))
+        app.flush_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.flush_urls()
+        os.chdir(cls.cwd)
+
+    # Função para percorrer todas as páginas seguindo next_cursor; retorna os IDs na ordem lida
+    def walk(self, sort, limit):
+        ids = []
+        cursor = ''
+        while True:
+            response = self.client.get(f'/api/urls?sort={sort}&limit={limit}&cursor={cursor}')
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertLessEqual(len(data['urls']), limit)
+            ids.extend(url['short_id'] for url in data['urls'])
+            if data['next_cursor'] is None:
+                return ids
+            cursor = data['next_cursor']
+
+    def test_created_order(self):
+        for limit in (1, 3, 8, 50):
+            self.assertEqual(self.walk('created', limit), [f'x{i}' for i in range(8)])
+
+    def test_access_order(self):
+        expected = ['x2', 'x5', 'x6', 'x0', 'x1', 'x3', 'x4', 'x7']
+        for limit in (1, 3, 8, 50):
+            self.assertEqual(self.walk('access', limit), expected)
+
+    def test_invalid_cursor(self):
+        for query in ('cursor=-5', 'cursor=abc', 'cursor=1.2', 'sort=access&cursor=3',
+                      'sort=access&cursor=0.-1', 'sort=access&cursor=-1.2', 'sort=other'):
+            self.assertEqual(self.client.get(f'/api/urls?{query}').status_code, 400, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
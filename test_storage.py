@@ -0,0 +1,100 @@
+# Testes da recuperação do armazenamento em log (LogStorage) depois de uma queda
+#
+# Uso: python -m unittest test_storage
+import os, shutil, tempfile, unittest
+from storage import LogStorage, save_json
+
+
+# Função para criar o registro de criação de um link de teste
+def create_record(short_id):
+    return {'op': 'create', 'url': {'original_url': f'https://example.com/{short_id}', 'short_id': short_id, 'access_count': 0}}
+
+
+class LogStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.directory, 'urls.log')
+        self.snapshot_path = os.path.join(self.directory, 'urls.snapshot.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open_storage(self):
+        return LogStorage(self.log_path, self.snapshot_path)
+
+    def test_torn_tail(self):
+        storage = self.open_storage()
+        storage.load()
+        storage.append([create_record('a'), {'op': 'access', 'short_id': 'a', 'count': 2}, create_record('b')])
+        valid_size = os.path.getsize(self.log_path)
+        line = storage.encode(dict(create_record('c'), seq=4))
+        with open(self.log_path, 'ab') as file:  # Escrita interrompida no meio da linha
+            file.write(line[:len(line) // 2])
+
+        storage = self.open_storage()
+        urls = storage.load()
+        self.assertEqual([(url['short_id'], url['access_count']) for url in urls], [('a', 2), ('b', 0)])
+        self.assertEqual(os.path.getsize(self.log_path), valid_size)
+        self.assertEqual(storage.seq, 3)
+
+        # A próxima gravação continua a partir do fim válido
+        storage.append([create_record('c')])
+        self.assertEqual([url['short_id'] for url in self.open_storage().load()], ['a', 'b', 'c'])
+
+    def test_bad_crc(self):
+        storage = self.open_storage()
+        storage.load()
+        storage.append([create_record('a')])
+        valid_size = os.path.getsize(self.log_path)
+        line = storage.encode(dict(create_record('b'), seq=2))
+        with open(self.log_path, 'ab') as file:  # Linha completa, mas com um byte trocado
+            file.write(line.replace(b'"b"', b'"x"'))
+            file.write(storage.encode(dict(create_record('c'), seq=3)))  # Depois do erro nada é aplicado
+
+        urls = self.open_storage().load()
+        self.assertEqual([url['short_id'] for url in urls], ['a'])
+        self.assertEqual(os.path.getsize(self.log_path), valid_size)
+
+    def test_crash_between_snapshot_and_truncate(self):
+        storage = self.open_storage()
+        storage.load()
+        storage.append([create_record('a'), {'op': 'access', 'short_id': 'a', 'count': 5}])
+        # Queda depois de gravar o snapshot e antes de esvaziar o log: o log ainda tem os
+        # registros que o snapshot já inclui
+        save_json(self.snapshot_path, {'seq': storage.seq, 'next_id': storage.next_id,
+                                       'urls': [{'original_url': 'https://example.com/a', 'short_id': 'a', 'access_count': 5}]})
+
+        storage = self.open_storage()
+        urls = storage.load()
+        self.assertEqual([(url['short_id'], url['access_count']) for url in urls], [('a', 5)])
+        storage.append([create_record('b'), {'op': 'access', 'short_id': 'a', 'count': 1}])
+
+        urls = self.open_storage().load()
+        self.assertEqual([(url['short_id'], url['access_count']) for url in urls], [('a', 6), ('b', 0)])
+
+    def test_reserve_replay(self):
+        storage = self.open_storage()
+        storage.load()
+        self.assertEqual(storage.reserve_ids(100), 0)
+        self.assertEqual(storage.reserve_ids(50), 100)
+
+        storage = self.open_storage()
+        storage.load()
+        self.assertEqual(storage.next_id, 150)
+        self.assertEqual(storage.reserve_ids(10), 150)  # Os valores reservados antes não se repetem
+
+        storage.compact(storage.load())  # O contador também sobrevive à compactação
+        storage = self.open_storage()
+        storage.load()
+        self.assertEqual(storage.next_id, 160)
+
+    def test_disable_replay(self):
+        storage = self.open_storage()
+        storage.load()
+        storage.append([create_record('a'), create_record('b'), {'op': 'disable', 'short_id': 'a'}])
+        urls = self.open_storage().load()
+        self.assertEqual([url.get('disabled', False) for url in urls], [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Testes da validação de URLs contra um servidor HTTP local (sem acesso à internet)
+#
+# Uso: python -m unittest test_validation
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket, threading, time, unittest
+import validation
+
+
+# Servidor de teste: /ok responde 200, /slow demora mais que o tempo limite de leitura e o
+# resto responde 404. Conta as requisições recebidas, para saber quando o cache foi usado.
+class StubHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_HEAD(self):
+        StubHandler.requests += 1
+        if self.path == '/slow':
+            time.sleep(validation.READ_TIMEOUT * 3)
+        self.send_response(200 if self.path in ('/ok', '/slow') else 404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Função para encontrar uma porta TCP sem nenhum servidor escutando
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class CheckUrlTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.read_timeout = validation.READ_TIMEOUT
+        validation.READ_TIMEOUT = 0.3
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        validation.READ_TIMEOUT = cls.read_timeout
+
+    def setUp(self):
+        validation.url_cache.clear()
+        validation.host_cache.clear()
+        StubHandler.requests = 0
+
+    def test_verdicts(self):
+        self.assertTrue(validation.check_url(self.base + '/ok'))
+        self.assertFalse(validation.check_url(self.base + '/missing'))
+        self.assertFalse(validation.check_url(self.base + '/slow'))
+        self.assertFalse(validation.check_url(f'http://127.0.0.1:{closed_port()}/ok'))
+
+    def test_url_cache(self):
+        for url in (self.base + '/ok', self.base + '/missing'):
+            verdict = validation.check_url(url)
+            hits = validation.url_cache.hits
+            self.assertEqual(validation.check_url(url), verdict)
+            self.assertEqual(validation.url_cache.hits, hits + 1)
+        self.assertEqual(StubHandler.requests, 2)  # Uma requisição por URL, a segunda veio do cache
+
+    def test_host_cache(self):
+        self.assertFalse(validation.check_url(self.base + '/slow'))  # Tempo esgotado: o site fica marcado
+        hits = validation.host_cache.hits
+        self.assertFalse(validation.check_url(self.base + '/ok'))
+        self.assertEqual(validation.host_cache.hits, hits + 1)
+        self.assertEqual(StubHandler.requests, 1)
+
+        base = f'http://127.0.0.1:{closed_port()}'
+        self.assertFalse(validation.check_url(base + '/a'))  # Conexão recusada
+        hits = validation.host_cache.hits
+        self.assertFalse(validation.check_url(base + '/b'))
+        self.assertEqual(validation.host_cache.hits, hits + 1)
+
+    def test_check_url_later(self):
+        invalid = []
+        valid = []
+        validation.check_url_later(self.base + '/ok', invalid.append, valid.append).result(timeout=5)
+        validation.check_url_later(self.base + '/missing', invalid.append, valid.append).result(timeout=5)
+        self.assertEqual(invalid, [self.base + '/missing'])
+        self.assertEqual(valid, [self.base + '/ok'])
+
+    def test_check_urls(self):
+        urls = [self.base + '/ok', self.base + '/missing']
+        self.assertEqual(validation.check_urls(urls), {urls[0]: True, urls[1]: False})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import os, time
+import requests
+from requests.adapters import HTTPAdapter
+from cache import TTLCache
+from metrics import Histogram
+
+# Tempo máximo (em segundos) para conectar e para aguardar a resposta do site
+CONNECT_TIMEOUT = float(os.environ.get('VALIDATION_CONNECT_TIMEOUT', 2))
+READ_TIMEOUT = float(os.environ.get('VALIDATION_READ_TIMEOUT', 3))
+
+# Por quanto tempo (em segundos) um veredito fica guardado no cache
+VALID_TTL = float(os.environ.get('VALIDATION_VALID_TTL', 3600))
+INVALID_TTL = float(os.environ.get('VALIDATION_INVALID_TTL', 300))
+CACHE_SIZE = int(os.environ.get('VALIDATION_CACHE_SIZE', 10000))
+
+# Quantidade de verificações simultâneas (e de conexões mantidas por site)
+MAX_WORKERS = int(os.environ.get('VALIDATION_WORKERS', 8))
+
+
+# Sessão com conexões reaproveitadas entre as verificações (evita um novo TCP/TLS a cada vez)
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+# Vereditos recentes por URL e sites que não responderam (para falhar rápido nas próximas URLs)
+url_cache = TTLCache(CACHE_SIZE)
+host_cache = TTLCache(CACHE_SIZE)
+
+# Threads usadas para validar em segundo plano
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='validation')
+
+# Tempo das requisições HEAD feitas aos sites (só as que não vieram do cache), por resultado
+head_latency = Histogram('shortener_validation_head_seconds', 'Tempo da requisição HEAD de validação', ('result',))
+
+
+# Função para verificar se a URL responde com status 200, usando o cache quando possível
+def check_url(url):
+    verdict = url_cache.get(url)
+    if verdict is not None:
+        return verdict
+
+    host = urlsplit(url).netloc
+    if host_cache.get(host) is False:  # O site não respondeu há pouco tempo
+        return False
+
+    start = time.perf_counter()
+    try:
+        response = session.head(url, allow_redirects=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        verdict = response.status_code == 200
+        result = 'valid' if verdict else 'invalid'
+    except (requests.ConnectionError, requests.Timeout):
+        host_cache.set(host, False, INVALID_TTL)  # O problema é do site, não só desta URL
+        verdict = False
+        result = 'unreachable'
+    except requests.RequestException:
+        verdict = False
+        result = 'error'
+    head_latency.observe(time.perf_counter() - start, result)
+
+    url_cache.set(url, verdict, VALID_TTL if verdict else INVALID_TTL)
+    return verdict
+
+
+# Função para validar a URL em segundo plano; on_invalid é chamada se ela não responder e
+# on_valid (opcional) se ela responder
+def check_url_later(url, on_invalid, on_valid=None):
+    def task():
+        if not check_url(url):
+            on_invalid(url)
+        elif on_valid is not None:
+            on_valid(url)
+    return executor.submit(task)
+
+
+# Função para validar várias URLs em paralelo; retorna um dicionário URL -> veredito
+def check_urls(urls):
+    urls = list(urls)
+    return dict(zip(urls, executor.map(check_url, urls)))